@@ -0,0 +1,152 @@
+import asyncio
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+
+from config import config
+from drive_client import get_drive_client
+from rate_limit import get_rate_limiter
+
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+
+
+class AsyncApi:
+    """Fachada asyncio para as chamadas ao Drive, Sheets e Google Ads.
+
+    As bibliotecas do Google são síncronas, então cada chamada roda num
+    executor compartilhado de ASYNC_API_WORKERS threads. A espera pelos
+    limites de requisição e o backoff dos retries acontecem no event loop
+    (RateLimiter.executar_async), com os mesmos token buckets do código
+    síncrono. Assim centenas de corrotinas podem ter requisições pendentes
+    ocupando só as threads das chamadas que estão de fato em andamento.
+
+    As conexões também são as mesmas: o Drive usa o DriveClient do processo
+    (uma conexão HTTP por thread do executor), o Sheets um serviço por thread
+    e o Google Ads o canal gRPC do GoogleAdsClient recebido.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or config.ASYNC_API_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="async-api")
+        self._local = threading.local()
+
+    async def _executar(self, api, func, *args, tokens=1, idempotente=True, **kwargs):
+        return await get_rate_limiter().executar_async(
+            api, self._executor, func, *args, tokens=tokens, idempotente=idempotente, **kwargs
+        )
+
+    async def _na_thread(self, func):
+        # Trabalho local (sem requisição à API) que ainda assim não deve bloquear o event loop
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+
+    # ------------------------ DRIVE ------------------------
+    @staticmethod
+    def _drive_pagina(query, fields, page_token):
+        # O request é montado na thread do executor, para usar a conexão HTTP dela
+        return get_drive_client().service.files().list(
+            q=f"{query} and trashed = false",
+            fields=f"nextPageToken, files({fields})",
+            pageSize=1000,
+            pageToken=page_token
+        ).execute_direto()
+
+    async def drive_listar(self, query, fields="id, name, mimeType"):
+        """files().list com paginação completa; retorna todos os arquivos da consulta."""
+        all_files = []
+        page_token = None
+        while True:
+            response = await self._executar("drive", self._drive_pagina, query, fields, page_token)
+            all_files.extend(response.get('files', []))
+            page_token = response.get('nextPageToken', None)
+            if not page_token:
+                return all_files
+
+    async def drive_metadados(self, file_id, fields="id, name, mimeType, md5Checksum, modifiedTime"):
+        """files().get de um arquivo."""
+        return await self._executar(
+            "drive", lambda: get_drive_client().service.files().get(fileId=file_id, fields=fields).execute_direto()
+        )
+
+    async def drive_download(self, file_id, inicio=None, fim=None):
+        """Baixa o conteúdo de um arquivo; cada chunk é uma requisição limitada separada.
+
+        Com inicio e fim, baixa só esses bytes (inclusive) numa única requisição com Range HTTP.
+        """
+        client = get_drive_client()
+        if inicio is not None:
+            def trecho():
+                request = client.service.files().get_media(fileId=file_id)
+                request.headers["Range"] = f"bytes={inicio}-{fim}"
+                return request.execute_direto()
+            return await self._executar("drive", trecho)
+
+        request = await self._na_thread(lambda: client.service.files().get_media(fileId=file_id))
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+
+        def next_chunk():
+            # Cada chunk pode rodar numa thread diferente: usa a conexão HTTP da thread atual
+            request.http = client.thread_http()
+            return downloader.next_chunk()
+
+        done = False
+        while done is False:
+            status, done = await self._executar("drive", next_chunk)
+        return fh.getvalue()
+
+    # ------------------------ SHEETS ------------------------
+    def _sheets_service(self):
+        service = getattr(self._local, "sheets", None)
+        if service is None:
+            creds = service_account.Credentials.from_service_account_file(config.SHEETS_CREDENTIALS_FILE, scopes=SHEETS_SCOPES)
+            service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+            self._local.sheets = service
+        return service
+
+    async def sheets_valores(self, spreadsheet_id=None, range_=None):
+        """spreadsheets().values().get; por padrão, a planilha e o intervalo do config."""
+        spreadsheet_id = spreadsheet_id or config.SHEET_ID
+        range_ = range_ or config.SHEET_RANGE
+        return await self._executar(
+            "sheets",
+            lambda: self._sheets_service().spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_).execute()
+        )
+
+    # ------------------------ GOOGLE ADS ------------------------
+    async def ads_search(self, client, customer_id, query):
+        """GoogleAdsService.search; retorna a lista de linhas (todas as páginas são lidas no executor)."""
+        google_ads_service = client.get_service("GoogleAdsService")
+        return await self._executar("ads", lambda: list(google_ads_service.search(customer_id=customer_id, query=query)))
+
+    async def ads_mutate_ad_group_ads(self, client, customer_id, operations, partial_failure=True):
+        """AdGroupAdService.mutate_ad_group_ads com as operações recebidas; retorna a resposta.
+
+        Criação não é idempotente: só repete se o Google Ads recusou por limite de requisições.
+        """
+        ad_group_ad_service = client.get_service("AdGroupAdService")
+        request = client.get_type("MutateAdGroupAdsRequest")
+        request.customer_id = customer_id
+        request.partial_failure = partial_failure
+        request.operations.extend(operations)
+        return await self._executar("ads", ad_group_ad_service.mutate_ad_group_ads, request=request, idempotente=False)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_async_api = None
+_async_api_lock = threading.Lock()
+
+
+def get_async_api():
+    """Retorna a AsyncApi única do processo."""
+    global _async_api
+    if _async_api is None:
+        with _async_api_lock:
+            if _async_api is None:
+                _async_api = AsyncApi()
+    return _async_api
@@ -0,0 +1,199 @@
+import json
+import os
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    yaml = None
+    YAML_AVAILABLE = False
+
+from config import config
+from render import PERFIS_PNG
+
+# Códigos de saída do modo batch (para cron e outros agendadores)
+SAIDA_OK = 0            # todos os grupos enviados (ou já concluídos)
+SAIDA_FALHAS = 1        # algum grupo falhou ou foi enviado parcialmente
+SAIDA_ERRO_SPEC = 2     # spec inválida ou nada a processar; nenhum grupo foi executado
+
+# Chaves de "paralelismo" -> atributo do config sobrescrito
+PARALELISMO = {
+    "fila": "PIPELINE_QUEUE_SIZE",
+    "logo": "PIPELINE_LOGO_WORKERS",
+    "render": "PIPELINE_RENDER_WORKERS",
+    "upload": "PIPELINE_UPLOAD_WORKERS",
+    "api": "ASYNC_API_WORKERS",
+}
+
+
+class SpecInvalida(Exception):
+    """Arquivo de job spec ausente, ilegível ou com valores inválidos."""
+
+
+def _quantidade(valor, onde):
+    if isinstance(valor, str) and valor.strip().lower() == "all":
+        return "all"
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise SpecInvalida(f"{onde}: quantidade deve ser um número ou 'all'")
+    try:
+        quantidade = int(valor)
+    except ValueError:
+        raise SpecInvalida(f"{onde}: quantidade deve ser um número ou 'all'")
+    if quantidade < 1:
+        raise SpecInvalida(f"{onde}: quantidade deve ser maior que zero")
+    return quantidade
+
+
+def _lista(valor, onde):
+    """Lista de textos; aceita também 'all' (retorna None) ou um texto separado por vírgulas."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        if valor.strip().lower() == "all":
+            return None
+        valor = valor.split(",")
+    if not isinstance(valor, list):
+        raise SpecInvalida(f"{onde}: esperada uma lista ou 'all'")
+    itens = [str(item).strip() for item in valor if str(item).strip()]
+    if not itens:
+        raise SpecInvalida(f"{onde}: lista vazia (use 'all' para não filtrar)")
+    return itens
+
+
+def _chave_grupo(chave):
+    """'conta/grupo' (com ou sem hífens na conta) -> (account_id, ad_group_id), ou None se for um nome de site."""
+    if "/" not in chave:
+        return None
+    conta, grupo = (parte.strip() for parte in chave.split("/", 1))
+    try:
+        return str(int(conta.replace("-", ""))), str(int(grupo))
+    except ValueError:
+        raise SpecInvalida(f"urls: chave '{chave}' deve ser 'conta/grupo' com IDs numéricos ou o nome de um site")
+
+
+class JobSpec:
+    """Execução em lote descrita num arquivo YAML ou JSON, sem nenhuma pergunta.
+
+    Exemplo:
+
+        paises: [Brasil, México]        # ou all (padrão)
+        campanhas: [all T1, Campanha X] # mesma sintaxe do modo interativo; all (padrão)
+        quantidade: 4                   # número ou all
+        templates: [template_a.png]     # opcional: templates específicos
+        encoder_profile: balanced       # opcional: perfil do encoder PNG
+        retomar: true                   # opcional: retoma a última execução desta seleção que não terminou
+        sites:                          # opcional: quantidade/templates por site
+          meusite.com: {quantidade: 2, templates: [template_b.gif]}
+        urls:                           # opcional: URL final no lugar da encontrada no grupo
+          123-456-7890/987654321: https://exemplo.com/a
+          meusite.com: https://meusite.com
+        paralelismo: {logo: 2, render: 4, upload: 2, fila: 2, api: 32}
+        relatorio: relatorios/resultado.csv   # opcional: .csv ou .json
+
+    Grupos sem URL final (nem no Google Ads nem em urls) falham na etapa url,
+    em vez de parar a execução esperando uma resposta.
+    """
+
+    CHAVES = {
+        "paises", "campanhas", "quantidade", "templates", "encoder_profile",
+        "retomar", "sites", "urls", "paralelismo", "relatorio",
+    }
+
+    def __init__(self, dados, origem="spec"):
+        if not isinstance(dados, dict):
+            raise SpecInvalida(f"{origem}: o conteúdo deve ser um objeto com as chaves {sorted(self.CHAVES)}")
+        desconhecidas = set(dados) - self.CHAVES
+        if desconhecidas:
+            raise SpecInvalida(f"{origem}: chave(s) desconhecida(s): {', '.join(sorted(desconhecidas))}")
+        if "quantidade" not in dados:
+            raise SpecInvalida(f"{origem}: 'quantidade' é obrigatória (número ou 'all')")
+
+        self.origem = origem
+        self.paises = _lista(dados.get("paises"), "paises")
+        self.campanhas = _lista(dados.get("campanhas"), "campanhas")
+        self.quantidade = _quantidade(dados["quantidade"], "quantidade")
+        self.templates = _lista(dados.get("templates"), "templates")
+
+        self.encoder_profile = dados.get("encoder_profile")
+        if self.encoder_profile is not None and self.encoder_profile not in PERFIS_PNG:
+            raise SpecInvalida(f"encoder_profile: use um de {', '.join(sorted(PERFIS_PNG))}")
+
+        self.retomar = dados.get("retomar", False)
+        if not isinstance(self.retomar, bool):
+            raise SpecInvalida("retomar: use true ou false")
+
+        self.sites = {}
+        sites = dados.get("sites") or {}
+        if not isinstance(sites, dict):
+            raise SpecInvalida("sites: esperado um objeto site -> {quantidade, templates}")
+        for site, ajustes in sites.items():
+            if not isinstance(ajustes, dict) or set(ajustes) - {"quantidade", "templates"}:
+                raise SpecInvalida(f"sites.{site}: use apenas as chaves quantidade e templates")
+            self.sites[str(site).strip().lower()] = {
+                "quantidade": _quantidade(ajustes["quantidade"], f"sites.{site}") if "quantidade" in ajustes else None,
+                "templates": _lista(ajustes.get("templates"), f"sites.{site}.templates"),
+            }
+
+        self.urls_grupo = {}
+        self.urls_site = {}
+        urls = dados.get("urls") or {}
+        if not isinstance(urls, dict):
+            raise SpecInvalida("urls: esperado um objeto 'conta/grupo' ou site -> URL")
+        for chave, url in urls.items():
+            if not isinstance(url, str) or not url.strip().lower().startswith(("http://", "https://")):
+                raise SpecInvalida(f"urls.{chave}: URL inválida")
+            grupo = _chave_grupo(str(chave))
+            if grupo:
+                self.urls_grupo[grupo] = url.strip()
+            else:
+                self.urls_site[str(chave).strip().lower()] = url.strip()
+
+        self.paralelismo = {}
+        paralelismo = dados.get("paralelismo") or {}
+        if not isinstance(paralelismo, dict) or set(paralelismo) - set(PARALELISMO):
+            raise SpecInvalida(f"paralelismo: use as chaves {', '.join(PARALELISMO)}")
+        for chave, valor in paralelismo.items():
+            if isinstance(valor, bool) or not isinstance(valor, int) or valor < 1:
+                raise SpecInvalida(f"paralelismo.{chave}: deve ser um inteiro maior que zero")
+            self.paralelismo[chave] = valor
+
+        self.relatorio = dados.get("relatorio")
+        if self.relatorio is not None and os.path.splitext(str(self.relatorio))[1].lower() not in (".csv", ".json"):
+            raise SpecInvalida("relatorio: o arquivo deve terminar em .csv ou .json")
+
+    def aplicar_config(self):
+        """Sobrescreve no config o perfil do encoder e o paralelismo pedidos (antes de criar pools e filas)."""
+        if self.encoder_profile:
+            config.PNG_ENCODER_PROFILE = self.encoder_profile
+        for chave, valor in self.paralelismo.items():
+            setattr(config, PARALELISMO[chave], valor)
+
+    def ajustar_job(self, job):
+        """Aplica a quantidade e os templates da spec (ou os do site, se houver) ao job."""
+        ajustes = self.sites.get(str(job.site).strip().lower(), {})
+        job.quantidade = ajustes.get("quantidade") or self.quantidade
+        job.templates_especificos = ajustes.get("templates") or self.templates
+
+    def url_final(self, job):
+        """URL final definida na spec para o job (por conta/grupo, depois por site), ou None."""
+        return self.urls_grupo.get((job.account_id, job.ad_group_id)) or self.urls_site.get(str(job.site).strip().lower())
+
+
+def carregar_spec(path):
+    """Lê e valida o job spec (.json, ou YAML para qualquer outra extensão)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            conteudo = f.read()
+    except OSError as e:
+        raise SpecInvalida(f"Não foi possível ler {path}: {e}")
+    erros = (ValueError, yaml.YAMLError) if YAML_AVAILABLE else (ValueError,)
+    try:
+        if path.lower().endswith(".json"):
+            dados = json.loads(conteudo)
+        elif YAML_AVAILABLE:
+            dados = yaml.safe_load(conteudo)
+        else:
+            raise SpecInvalida(f"{path}: PyYAML não está instalado; use um job spec .json")
+    except erros as e:
+        raise SpecInvalida(f"{path}: conteúdo inválido: {e}")
+    return JobSpec(dados, origem=path)
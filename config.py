@@ -30,9 +30,71 @@ class Config:
     IMAGE_HEIGHT = int(os.getenv("IMAGE_HEIGHT", "280"))
     LOGO_WIDTH = int(os.getenv("LOGO_WIDTH", "45"))
     LOGO_HEIGHT = int(os.getenv("LOGO_HEIGHT", "14"))
+    PREPARED_LOGO_CACHE_MB = int(os.getenv("PREPARED_LOGO_CACHE_MB", "64"))  # logos decodificadas em memória
+    
+    # Rendering
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0"))  # 0 = um processo por núcleo
+    RENDER_POOL_MIN_JOBS = int(os.getenv("RENDER_POOL_MIN_JOBS", "4"))  # abaixo disso renderiza no próprio processo
+    RENDER_LOTE_MAX_LOGOS = int(os.getenv("RENDER_LOTE_MAX_LOGOS", "32"))  # logos por job do pool num template PNG compartilhado; 1 = desativado
+    PNG_ENCODER_PROFILE = os.getenv("PNG_ENCODER_PROFILE", "balanced")  # fast, balanced ou smallest
+    MAX_CREATIVE_BYTES = int(os.getenv("MAX_CREATIVE_BYTES", str(150 * 1024)))  # limite do Google Ads para anúncios de imagem
+    GIF_PALETTE_SAMPLES = int(os.getenv("GIF_PALETTE_SAMPLES", "4"))  # frames usados para calcular a paleta global do GIF
+    
+    # Render Cache (criativos já codificados)
+    RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "cache/render")
+    RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "256"))  # 0 = desativado
+    
+    # Templates pré-redimensionados para DIMENSOES
+    PREPARED_TEMPLATE_DIR = os.getenv("PREPARED_TEMPLATE_DIR", "cache/templates")
+    PREPARED_TEMPLATE_MAX_MB = int(os.getenv("PREPARED_TEMPLATE_MAX_MB", "512"))  # 0 = desativado
+    PREPARED_TEMPLATE_WARMUP = os.getenv("PREPARED_TEMPLATE_WARMUP", "true").lower() == "true"  # prepara ao mudar o manifesto
+    PREPARED_TEMPLATE_WARMUP_MAX = int(os.getenv("PREPARED_TEMPLATE_WARMUP_MAX", "8"))  # templates por aviso do manifesto
+    
+    # Pipeline de campanhas (workers por etapa e tamanho das filas entre etapas)
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+    PIPELINE_LOGO_WORKERS = int(os.getenv("PIPELINE_LOGO_WORKERS", "2"))
+    PIPELINE_RENDER_WORKERS = int(os.getenv("PIPELINE_RENDER_WORKERS", "2"))
+    PIPELINE_UPLOAD_WORKERS = int(os.getenv("PIPELINE_UPLOAD_WORKERS", "2"))
+    
+    # Diário de execução (retomada com --resume); vazio = desativado
+    JOURNAL_FILE = os.getenv("JOURNAL_FILE", "cache/journal.sqlite3")
+    
+    # Google Drive HTTP
+    DRIVE_HTTP_TIMEOUT = int(os.getenv("DRIVE_HTTP_TIMEOUT", "60"))
+    DRIVE_BATCH_SIZE = int(os.getenv("DRIVE_BATCH_SIZE", "100"))  # requisições por chamada batch
+    
+    # Logo Catalog
+    LOGO_CATALOG_TTL = int(os.getenv("LOGO_CATALOG_TTL", "3600"))  # segundos
+    LOGO_CATALOG_FILE = os.getenv("LOGO_CATALOG_FILE", "")  # vazio = sem persistência em disco
+    
+    # Downloads paralelos de templates
+    DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+    
+    # Template Manifest
+    TEMPLATE_MANIFEST_TTL = int(os.getenv("TEMPLATE_MANIFEST_TTL", "3600"))  # segundos
+    TEMPLATE_PROBE = os.getenv("TEMPLATE_PROBE", "false").lower() == "true"  # lê o cabeçalho antes de escolher
+    TEMPLATE_PROBE_BYTES = int(os.getenv("TEMPLATE_PROBE_BYTES", str(64 * 1024)))
+    TEMPLATE_MAX_ASPECT_DIFF = float(os.getenv("TEMPLATE_MAX_ASPECT_DIFF", "0.15"))  # desvio relativo da proporção de DIMENSOES
+    
+    # Local Drive Cache (templates e logos)
+    DRIVE_CACHE_DIR = os.getenv("DRIVE_CACHE_DIR", "cache/drive")
+    DRIVE_CACHE_MAX_MB = int(os.getenv("DRIVE_CACHE_MAX_MB", "1024"))
     
     # Request Limits
-    MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "3000"))
+    MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "3000"))  # requisições por hora ao Google Ads
+    DRIVE_REQUESTS_PER_SECOND = float(os.getenv("DRIVE_REQUESTS_PER_SECOND", "10"))
+    SHEETS_REQUESTS_PER_SECOND = float(os.getenv("SHEETS_REQUESTS_PER_SECOND", "1"))
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "6"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # segundos
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))  # segundos
+    
+    ASYNC_API_WORKERS = int(os.getenv("ASYNC_API_WORKERS", "32"))  # threads da camada asyncio (chamadas em andamento)
+    
+    # Google Ads
+    UPLOAD_SKIP_DUPLICATES = os.getenv("UPLOAD_SKIP_DUPLICATES", "true").lower() == "true"  # não reenvia anúncios que já estão no grupo
+    ADS_QUERY_CHUNK_SIZE = int(os.getenv("ADS_QUERY_CHUNK_SIZE", "500"))  # grupos por cláusula IN
+    ADS_MUTATE_MAX_OPERATIONS = int(os.getenv("ADS_MUTATE_MAX_OPERATIONS", "1000"))  # operações por mutate
+    ADS_MUTATE_MAX_BYTES = int(os.getenv("ADS_MUTATE_MAX_BYTES", str(30 * 1024 * 1024)))  # payload por mutate
     
     # Directories
     OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
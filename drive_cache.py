@@ -0,0 +1,627 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image
+
+from async_api import get_async_api
+from config import config
+from drive_client import get_drive_client
+
+
+def listar_arquivos(query, fields="id, name, mimeType"):
+    """Executa uma consulta files().list no Drive, seguindo a paginação até o fim (AsyncApi.drive_listar)."""
+    return asyncio.run(get_async_api().drive_listar(query, fields))
+
+
+def listar_arquivos_em_lote(queries, fields="id, name, mimeType"):
+    """Executa várias consultas files().list em lotes batch, paginando todas em paralelo.
+
+    Retorna uma lista com os arquivos de cada consulta, na mesma ordem.
+    """
+    client = get_drive_client()
+    service = client.service
+    results = [[] for _ in queries]
+    pending = [(index, None) for index in range(len(queries))]
+    while pending:
+        requests = [
+            service.files().list(
+                q=f"{queries[index]} and trashed = false",
+                fields=f"nextPageToken, files({fields})",
+                pageSize=1000,
+                pageToken=page_token
+            )
+            for index, page_token in pending
+        ]
+        next_pending = []
+        for (index, _), result in zip(pending, client.execute_batch(requests)):
+            if result.error is not None:
+                raise result.error
+            results[index].extend(result.response.get('files', []))
+            if result.response.get('nextPageToken'):
+                next_pending.append((index, result.response['nextPageToken']))
+        pending = next_pending
+    return results
+
+
+def obter_metadados(file_ids, fields="id, name, mimeType, md5Checksum, modifiedTime"):
+    """Busca os metadados de vários arquivos em lotes batch.
+
+    Retorna um dict id -> BatchResult, com a resposta ou o erro de cada arquivo.
+    """
+    client = get_drive_client()
+    service = client.service
+    requests = [service.files().get(fileId=file_id, fields=fields) for file_id in file_ids]
+    return dict(zip(file_ids, client.execute_batch(requests)))
+
+
+def listar_pasta(folder_id, query_extra=None, fields="id, name, mimeType"):
+    """Lista todos os arquivos de uma pasta do Drive."""
+    query = f"'{folder_id}' in parents"
+    if query_extra:
+        query += f" and {query_extra}"
+    return listar_arquivos(query, fields)
+
+
+# ------------------------ CATÁLOGO DE LOGOS ------------------------
+def normalizar_nome_logo(nome):
+    """Normaliza o nome de um site/arquivo de logo para a chave do catálogo."""
+    nome = nome.strip().lower()
+    if nome.endswith(".png"):
+        nome = nome[:-4]
+    return nome.strip()
+
+
+class LogoCatalog:
+    """Índice nome normalizado -> arquivo da pasta de logos.
+
+    A pasta é listada uma vez por janela de TTL; as buscas seguintes são
+    respondidas do dicionário em memória, sem chamadas ao Drive. Se
+    persist_path for informado, o índice é salvo em disco e reaproveitado
+    na próxima execução enquanto ainda estiver dentro do TTL.
+    """
+
+    FIELDS = "id, name, md5Checksum, modifiedTime, size"
+
+    def __init__(self, folder_id=None, ttl=None, persist_path=None):
+        self.folder_id = folder_id or config.LOGOS_DRIVE_FOLDER_ID
+        self.ttl = config.LOGO_CATALOG_TTL if ttl is None else ttl
+        self.persist_path = config.LOGO_CATALOG_FILE if persist_path is None else persist_path
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._index = {}
+        self._loaded_at = 0.0
+        self._disk_checked = False
+
+    def _expired(self):
+        return not self._loaded_at or (time.time() - self._loaded_at) > self.ttl
+
+    def _load_from_disk(self):
+        # O disco só é consultado na primeira carga do processo
+        if self._disk_checked:
+            return False
+        self._disk_checked = True
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return False
+        try:
+            with open(self.persist_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Catálogo de logos em disco ignorado: {e}")
+            return False
+        if data.get("folder_id") != self.folder_id:
+            return False
+        if (time.time() - data.get("loaded_at", 0)) > self.ttl:
+            return False
+        self._index = data.get("files", {})
+        self._loaded_at = data["loaded_at"]
+        print(f"📋 Catálogo de logos carregado do disco ({len(self._index)} logos)")
+        return True
+
+    def _save_to_disk(self):
+        if not self.persist_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"folder_id": self.folder_id, "loaded_at": self._loaded_at, "files": self._index}, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠️ Não foi possível salvar o catálogo de logos: {e}")
+
+    def refresh(self):
+        """Relista a pasta de logos no Drive e reconstrói o índice."""
+        files = listar_pasta(self.folder_id, "mimeType = 'image/png'", self.FIELDS)
+        index = {}
+        for file in files:
+            # Em caso de nomes repetidos, mantém o primeiro, como a busca linear fazia
+            index.setdefault(normalizar_nome_logo(file['name']), file)
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.time()
+            self._save_to_disk()
+        print(f"🎨 Catálogo de logos atualizado ({len(index)} logos)")
+        return index
+
+    def _ensure_fresh(self):
+        if not self._expired():
+            return
+        with self._refresh_lock:
+            with self._lock:
+                if not self._expired() or self._load_from_disk():
+                    return
+            self.refresh()
+
+    def lookup(self, site):
+        """Retorna o arquivo (dict do Drive) da logo do site, ou None."""
+        self._ensure_fresh()
+        return self._index.get(normalizar_nome_logo(site))
+
+    def files(self):
+        """Retorna todos os arquivos de logo do catálogo."""
+        self._ensure_fresh()
+        return list(self._index.values())
+
+    def invalidate(self):
+        """Força a relistagem na próxima busca."""
+        with self._lock:
+            self._loaded_at = 0.0
+            self._disk_checked = True
+
+
+_logo_catalog = None
+_logo_catalog_lock = threading.Lock()
+
+
+def get_logo_catalog():
+    """Retorna o catálogo de logos único do processo."""
+    global _logo_catalog
+    if _logo_catalog is None:
+        with _logo_catalog_lock:
+            if _logo_catalog is None:
+                _logo_catalog = LogoCatalog()
+    return _logo_catalog
+
+
+# ------------------------ MANIFESTO DE TEMPLATES ------------------------
+Template = namedtuple("Template", ["id", "name", "mime_type", "size", "checksum", "modified_time"])
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+TEMPLATE_MIME_TYPES = ("image/png", "image/gif")
+
+
+class TemplateManifest:
+    """Mapa pasta (idioma ou tag) -> templates da pasta de templates do Drive.
+
+    As subpastas de TEMPLATES_DRIVE_FOLDER_ID são listadas uma vez e o
+    conteúdo de todas elas é buscado com poucas consultas agrupadas
+    ("'a' in parents or 'b' in parents ..."), com paginação completa. As
+    buscas seguintes são respondidas da memória até o TTL expirar.
+    """
+
+    # Quantidade de pastas por consulta, para não estourar o tamanho máximo da query
+    PARENTS_PER_QUERY = 40
+    FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime, parents"
+
+    def __init__(self, root_folder_id=None, ttl=None):
+        self.root_folder_id = root_folder_id or config.TEMPLATES_DRIVE_FOLDER_ID
+        self.ttl = config.TEMPLATE_MANIFEST_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._folders = {}
+        self._templates = {}
+        self._loaded_at = 0.0
+        self._listeners = []
+
+    def _expired(self):
+        return not self._loaded_at or (time.time() - self._loaded_at) > self.ttl
+
+    def refresh(self):
+        """Relista as subpastas e seus templates no Drive."""
+        folders = listar_pasta(self.root_folder_id, f"mimeType = '{FOLDER_MIME_TYPE}'", "id, name")
+        folder_names = {folder['id']: folder['name'] for folder in folders}
+        templates = {folder['id']: [] for folder in folders}
+        mime_query = " or ".join(f"mimeType = '{mime}'" for mime in TEMPLATE_MIME_TYPES)
+        folder_ids = list(folder_names)
+        queries = []
+        for start in range(0, len(folder_ids), self.PARENTS_PER_QUERY):
+            chunk = folder_ids[start:start + self.PARENTS_PER_QUERY]
+            parents_query = " or ".join(f"'{folder_id}' in parents" for folder_id in chunk)
+            queries.append(f"({parents_query}) and ({mime_query})")
+        # Todas as consultas (e suas páginas seguintes) vão em chamadas batch
+        for files in listar_arquivos_em_lote(queries, self.FIELDS):
+            for file in files:
+                entry = Template(
+                    file['id'],
+                    file['name'],
+                    file['mimeType'],
+                    int(file.get('size', 0)),
+                    file.get('md5Checksum', ""),
+                    file.get('modifiedTime', "")
+                )
+                for parent in file.get('parents', []):
+                    if parent in templates:
+                        templates[parent].append(entry)
+        with self._lock:
+            anteriores = {entry for entries in self._templates.values() for entry in entries}
+            # Em caso de pastas com o mesmo nome, mantém a primeira, como a consulta com pageSize=1 fazia
+            self._folders = {}
+            for folder_id, name in folder_names.items():
+                self._folders.setdefault(name, folder_id)
+            self._templates = templates
+            self._loaded_at = time.time()
+            listeners = list(self._listeners)
+        total = sum(len(entries) for entries in templates.values())
+        print(f"📋 Manifesto de templates atualizado ({len(folders)} pastas, {total} templates)")
+        alterados = list(dict.fromkeys(entry for entries in templates.values() for entry in entries if entry not in anteriores))
+        if alterados:
+            for listener in listeners:
+                listener(alterados)
+
+    def on_change(self, callback):
+        """Registra callback(templates) chamado com os templates novos ou alterados a cada refresh.
+
+        Se o manifesto já estiver carregado, chama na hora com todos os templates.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+            atuais = list(dict.fromkeys(entry for entries in self._templates.values() for entry in entries))
+        if atuais:
+            callback(atuais)
+
+    def _ensure_fresh(self):
+        if not self._expired():
+            return
+        with self._refresh_lock:
+            if self._expired():
+                self.refresh()
+
+    def _folder_id(self, folder_name):
+        folder_id = self._folders.get(folder_name)
+        if folder_id is None:
+            # Tolera diferenças de maiúsculas e espaços (ex.: "Espanhol " em IDIOMAS_POR_PAIS)
+            target = folder_name.strip().lower()
+            for name, candidate in self._folders.items():
+                if name.strip().lower() == target:
+                    return candidate
+        return folder_id
+
+    def get(self, folder_name):
+        """Retorna a lista de Template da pasta, ou None se a pasta não existir."""
+        self._ensure_fresh()
+        folder_id = self._folder_id(folder_name)
+        if folder_id is None:
+            return None
+        return list(self._templates.get(folder_id, []))
+
+    def folders(self):
+        """Retorna os nomes das subpastas de templates."""
+        self._ensure_fresh()
+        return sorted(self._folders)
+
+    def invalidate(self):
+        """Força a relistagem na próxima busca."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+_template_manifest = None
+_template_manifest_lock = threading.Lock()
+
+
+def get_template_manifest():
+    """Retorna o manifesto de templates único do processo."""
+    global _template_manifest
+    if _template_manifest is None:
+        with _template_manifest_lock:
+            if _template_manifest is None:
+                _template_manifest = TemplateManifest()
+    return _template_manifest
+
+
+# ------------------------ SONDAGEM DE TEMPLATES ------------------------
+# Informações lidas só do cabeçalho do arquivo. frames é None e animado pode ser
+# None quando o trecho lido não basta para saber (GIF maior que o trecho).
+TemplateProbe = namedtuple("TemplateProbe", ["width", "height", "mode", "frames", "animado"])
+
+
+def extensao_template(template):
+    """Extensão do criativo gerado a partir do template, pelo mimeType do manifesto."""
+    return ".gif" if template.mime_type == "image/gif" else ".png"
+
+
+def ler_cabecalho(data, completo):
+    """Extrai um TemplateProbe dos primeiros bytes de uma imagem (completo: data é o arquivo inteiro)."""
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if image.format != "GIF":
+        # PNG (inclusive APNG, cujo acTL vem antes dos dados) informa os frames no cabeçalho
+        frames = getattr(image, "n_frames", 1)
+        return TemplateProbe(width, height, image.mode, frames, frames > 1)
+    try:
+        image.seek(1)
+        animado = True
+    except EOFError:
+        animado = False if completo else None
+    except (OSError, SyntaxError):
+        animado = None
+    frames = None
+    if completo:
+        try:
+            frames = image.n_frames
+        except (OSError, SyntaxError):
+            pass
+    return TemplateProbe(width, height, image.mode, frames, animado)
+
+
+class TemplateProber:
+    """Lê só o começo de cada template (Range HTTP) para saber dimensões, modo e frames.
+
+    Os resultados ficam em memória por id + versão, então cada versão de um
+    template é sondada uma única vez por processo.
+    """
+
+    def __init__(self, probe_bytes=None):
+        self.probe_bytes = probe_bytes or config.TEMPLATE_PROBE_BYTES
+        self._lock = threading.Lock()
+        self._probes = {}
+
+    async def probe_async(self, template):
+        """Retorna o TemplateProbe do template, ou None se o cabeçalho não puder ser lido."""
+        key = (template.id, template.checksum or template.modified_time)
+        with self._lock:
+            if key in self._probes:
+                return self._probes[key]
+        try:
+            data = await get_async_api().drive_download(template.id, 0, self.probe_bytes - 1)
+            completo = len(data) < self.probe_bytes or (template.size and len(data) >= template.size)
+            probe = ler_cabecalho(data, completo)
+        except Exception as e:
+            print(f"⚠️ Não foi possível ler o cabeçalho de {template.name}: {e}")
+            probe = None
+        with self._lock:
+            self._probes[key] = probe
+        return probe
+
+    def probe(self, template):
+        """Versão síncrona de probe_async."""
+        return asyncio.run(self.probe_async(template))
+
+    async def _probe_many_async(self, templates):
+        return await asyncio.gather(*(self.probe_async(template) for template in templates))
+
+    def probe_many(self, templates):
+        """Sonda vários templates ao mesmo tempo pela AsyncApi; retorna os TemplateProbe na mesma ordem."""
+        if not templates:
+            return []
+        return list(asyncio.run(self._probe_many_async(templates)))
+
+
+_template_prober = None
+_template_prober_lock = threading.Lock()
+
+
+def get_template_prober():
+    """Retorna o TemplateProber único do processo."""
+    global _template_prober
+    if _template_prober is None:
+        with _template_prober_lock:
+            if _template_prober is None:
+                _template_prober = TemplateProber()
+    return _template_prober
+
+
+# ------------------------ CACHE LOCAL DE ARQUIVOS ------------------------
+def versao_arquivo(file):
+    """Versão de um arquivo do Drive: md5Checksum quando existe, senão modifiedTime."""
+    return file.get('md5Checksum') or file.get('modifiedTime') or ""
+
+
+class DiscoLRU:
+    """Arquivos num diretório, com índice em index.json e tamanho total limitado (LRU).
+
+    Base do FileCache e do RenderCache. Cada entrada do índice tem o nome do
+    arquivo no diretório (blob), o tamanho e o último acesso; as subclasses
+    acrescentam os campos de que precisam. Passando de max_bytes, os
+    arquivos usados há mais tempo são removidos primeiro.
+    """
+
+    def __init__(self, cache_dir, max_bytes, nome):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.nome = nome
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def _load_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Índice do {self.nome.lower()} ignorado: {e}")
+            return {}
+        for key, entry in index.items():
+            entry.setdefault('blob', key)
+        # Descarta entradas cujo arquivo sumiu do disco
+        return {k: v for k, v in index.items() if os.path.exists(os.path.join(self.cache_dir, v['blob']))}
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _remove_entry(self, key):
+        entry = self._index.pop(key, None)
+        if entry:
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['blob']))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep=None):
+        total = sum(entry['size'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entry['size']
+            self._remove_entry(key)
+
+    def _acessar(self, key):
+        """Entrada da chave com o último acesso atualizado, ou None (chamar com o lock)."""
+        entry = self._index.get(key)
+        if entry is not None:
+            entry['last_access'] = time.time()
+        return entry
+
+    def _gravar(self, key, blob, data, **campos):
+        """Grava os bytes como blob, registra a entrada da chave e aplica o limite; retorna o caminho."""
+        path = os.path.join(self.cache_dir, blob)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._index.get(key)
+            if old and old['blob'] != blob:
+                self._remove_entry(key)
+            self._index[key] = dict(campos, blob=blob, size=len(data), last_access=time.time())
+            self._evict(keep=key)
+            self._save_index()
+        return path
+
+    def _ler(self, key, path):
+        """Lê o arquivo da entrada; None se ele foi removido por outra thread (eviction) depois da busca."""
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._index.pop(key, None)
+            return None
+
+    def contem(self, key):
+        """Indica se a chave está no cache."""
+        with self._lock:
+            return key in self._index
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                self._remove_entry(key)
+            self._save_index()
+
+
+class FileCache(DiscoLRU):
+    """Cache em disco de arquivos do Drive, endereçado por id + versão.
+
+    Cada arquivo é guardado como <id>-<hash da versão>; uma entrada só é
+    reaproveitada se a versão informada pela listagem do Drive for a mesma.
+    O tamanho total é limitado a max_bytes, removendo primeiro os arquivos
+    usados há mais tempo (LRU). O índice é mantido em index.json.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        super().__init__(
+            cache_dir or config.DRIVE_CACHE_DIR,
+            config.DRIVE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            "Cache local"
+        )
+        self._key_locks = {}
+
+    def _key_lock(self, file_id):
+        with self._lock:
+            return self._key_locks.setdefault(file_id, threading.Lock())
+
+    def _blob_name(self, file_id, version):
+        return f"{file_id}-{hashlib.sha1(version.encode()).hexdigest()[:16]}"
+
+    def _lookup(self, file_id, version):
+        with self._lock:
+            entry = self._index.get(file_id)
+            if entry and entry['version'] == version:
+                return os.path.join(self.cache_dir, self._acessar(file_id)['blob'])
+        return None
+
+    def _fetch_versions(self, file_ids):
+        """Versão atual de vários arquivos no Drive (file_id -> versão), numa chamada batch."""
+        versions = {}
+        for file_id, result in obter_metadados(file_ids, "id, md5Checksum, modifiedTime").items():
+            if result.error is not None:
+                raise result.error
+            versions[file_id] = versao_arquivo(result.response)
+        return versions
+
+    def _fetch(self, file_id, version, expected_md5):
+        """Retorna (caminho, bytes) do arquivo; bytes é None quando veio do cache sem download."""
+        if version is None:
+            version = self._fetch_versions([file_id])[file_id]
+        path = self._lookup(file_id, version)
+        if path:
+            return path, None
+        with self._key_lock(file_id):
+            # Outra thread pode ter baixado enquanto esperávamos
+            path = self._lookup(file_id, version)
+            if path:
+                return path, None
+            data = get_drive_client().download_bytes(file_id)
+            if expected_md5 and hashlib.md5(data).hexdigest() != expected_md5:
+                raise Exception(f"Checksum divergente ao baixar {file_id}")
+            return self._gravar(file_id, self._blob_name(file_id, version), data, version=version), data
+
+    def get_path(self, file_id, version=None, expected_md5=None):
+        """Retorna o caminho local do arquivo, baixando-o só se não estiver no cache ou tiver mudado.
+
+        Se version não for informada, consulta os metadados do arquivo no Drive
+        (bem mais barato que baixar o conteúdo).
+        """
+        return self._fetch(file_id, version, expected_md5)[0]
+
+    def get_bytes(self, file_id, version=None, expected_md5=None):
+        """Retorna o conteúdo do arquivo em memória.
+
+        Num download novo, devolve os próprios bytes baixados (o disco só é
+        escrito para o cache); num acerto, lê o arquivo do cache uma vez.
+        """
+        path, data = self._fetch(file_id, version, expected_md5)
+        if data is None:
+            data = self._ler(file_id, path)
+        if data is None:
+            data = self._fetch(file_id, version, expected_md5)[1]
+        return data
+
+    def get_template_bytes(self, template):
+        """Atalho para get_bytes a partir de um Template do manifesto."""
+        version = template.checksum or template.modified_time or None
+        return self.get_bytes(template.id, version, template.checksum or None)
+
+    def get_file(self, file):
+        """Atalho para get_path a partir de um dict de arquivo da listagem do Drive."""
+        version = versao_arquivo(file) or None
+        return self.get_path(file['id'], version, file.get('md5Checksum'))
+
+
+_file_cache = None
+_file_cache_lock = threading.Lock()
+
+
+def get_file_cache():
+    """Retorna o cache local de arquivos único do processo."""
+    global _file_cache
+    if _file_cache is None:
+        with _file_cache_lock:
+            if _file_cache is None:
+                _file_cache = FileCache()
+    return _file_cache
@@ -0,0 +1,170 @@
+import io
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
+
+from config import config
+from rate_limit import classificar_erro, executar_com_limite, get_rate_limiter
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+
+# Resultado de uma requisição dentro de um lote: resposta ou erro (o outro campo fica None)
+BatchResult = namedtuple("BatchResult", ["response", "error"])
+
+
+class LimitedHttpRequest(HttpRequest):
+    """HttpRequest que passa pelo limite de requisições do Drive e repete erros transitórios."""
+
+    def execute(self, http=None, num_retries=0):
+        return executar_com_limite("drive", super().execute, http=http, num_retries=num_retries)
+
+    def execute_direto(self, http=None, num_retries=0):
+        """Executa sem passar pelo limite, para quem já o aplica (ex.: a camada asyncio)."""
+        return super().execute(http=http, num_retries=num_retries)
+
+
+class DriveClient:
+    """Cliente do Google Drive compartilhado pelo processo inteiro.
+
+    O serviço de discovery é construído uma única vez. Cada thread recebe sua
+    própria conexão HTTP (httplib2 não é thread-safe), que é mantida aberta e
+    reaproveitada entre as requisições. O token é renovado sob demanda pelo
+    AuthorizedHttp, e o teste de conexão roda só uma vez.
+    """
+
+    def __init__(self, credentials_file=None, timeout=None):
+        self.credentials_file = credentials_file or config.DRIVE_CREDENTIALS_FILE
+        self.timeout = timeout or config.DRIVE_HTTP_TIMEOUT
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._credentials = None
+        self._service = None
+        self._healthy = False
+
+    def _load_credentials(self):
+        # Cria o arquivo a partir da variável de ambiente, se necessário
+        if not os.path.exists(self.credentials_file) and config.DRIVE_CREDENTIALS_CONTENT:
+            print(f"📝 Criando {self.credentials_file} a partir da variável de ambiente...")
+            with open(self.credentials_file, "w") as f:
+                f.write(config.DRIVE_CREDENTIALS_CONTENT)
+            print(f"✅ Arquivo {self.credentials_file} criado")
+
+        if not os.path.exists(self.credentials_file):
+            raise Exception(f"Arquivo {self.credentials_file} não encontrado")
+
+        with open(self.credentials_file, "r") as f:
+            if not f.read().strip():
+                raise Exception(f"Arquivo {self.credentials_file} está vazio")
+
+        return service_account.Credentials.from_service_account_file(self.credentials_file, scopes=DRIVE_SCOPES)
+
+    def _thread_http(self):
+        """Retorna a conexão HTTP autenticada da thread atual, criando-a na primeira chamada."""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=httplib2.Http(timeout=self.timeout))
+            self._local.http = http
+        return http
+
+    def thread_http(self):
+        """Conexão HTTP autenticada da thread atual (requer o serviço já inicializado)."""
+        return self._thread_http()
+
+    def _build_request(self, http, *args, **kwargs):
+        # Ignora o http recebido do discovery e usa a conexão da thread que executa a requisição
+        return LimitedHttpRequest(self._thread_http(), *args, **kwargs)
+
+    @property
+    def service(self):
+        """Serviço do Drive v3, construído na primeira utilização."""
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._credentials = self._load_credentials()
+                    self._service = build(
+                        'drive', 'v3',
+                        http=self._thread_http(),
+                        requestBuilder=self._build_request,
+                        cache_discovery=False
+                    )
+                    print("📋 Serviço do Google Drive inicializado")
+        return self._service
+
+    def health_check(self, force=False):
+        """Testa a conexão com o Drive uma vez por processo (ou sempre, com force=True)."""
+        if self._healthy and not force:
+            return True
+        print("🔍 Testando conexão com Google Drive...")
+        self.service.files().list(pageSize=1, fields="files(id)").execute()
+        self._healthy = True
+        print("✅ Conexão com Google Drive estabelecida")
+        return True
+
+    def execute_batch(self, requests):
+        """Executa várias requisições de metadados em chamadas batch multipart.
+
+        Recebe uma lista de HttpRequest (ainda não executados) e devolve uma
+        lista de BatchResult na mesma ordem. Erros de uma requisição não
+        interrompem as demais; cada um volta no campo error do seu resultado.
+        """
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = BatchResult(response, exception)
+
+        limiter = get_rate_limiter()
+        batch_size = max(1, min(config.DRIVE_BATCH_SIZE, 100))  # limite do Drive: 100 por lote
+        pending = list(range(len(requests)))
+        for attempt in range(1, limiter.max_attempts + 1):
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index in chunk:
+                    batch.add(requests[index], request_id=str(index))
+                executar_com_limite("drive", batch.execute, http=self._thread_http(), tokens=len(chunk))
+            # Repete só as requisições do lote que falharam com erro transitório (ex.: 429)
+            pending = [i for i in pending if results[i].error is not None and classificar_erro(results[i].error)[0]]
+            if not pending or attempt == limiter.max_attempts:
+                break
+            time.sleep(random.uniform(0, min(limiter.max_delay, limiter.base_delay * (2 ** (attempt - 1)))))
+        return results
+
+    def download_bytes(self, file_id):
+        """Baixa o conteúdo de um arquivo do Drive e retorna os bytes."""
+        request = self.service.files().get_media(fileId=file_id)
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while done is False:
+            status, done = executar_com_limite("drive", downloader.next_chunk)
+        return fh.getvalue()
+
+    def reset(self):
+        """Descarta o serviço e as credenciais (ex.: após trocar o arquivo de credenciais)."""
+        with self._lock:
+            self._service = None
+            self._credentials = None
+            self._healthy = False
+            self._local = threading.local()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_drive_client():
+    """Retorna o DriveClient único do processo."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DriveClient()
+    return _client
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from config import config
+
+# Versão do esquema; diários de versões anteriores são recriados
+VERSAO_ESQUEMA = 3
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS execucoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    selecao TEXT NOT NULL,
+    iniciada_em REAL NOT NULL,
+    terminada_em REAL
+);
+CREATE TABLE IF NOT EXISTS grupos (
+    execucao INTEGER NOT NULL,
+    account_id TEXT NOT NULL,
+    ad_group_id TEXT NOT NULL,
+    site TEXT,
+    status TEXT NOT NULL,
+    erro TEXT,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (execucao, account_id, ad_group_id)
+);
+CREATE TABLE IF NOT EXISTS criativos (
+    execucao INTEGER NOT NULL,
+    account_id TEXT NOT NULL,
+    ad_group_id TEXT NOT NULL,
+    caminho TEXT NOT NULL,
+    sha1 TEXT NOT NULL,
+    status TEXT NOT NULL,
+    resource_name TEXT,
+    erro TEXT,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (execucao, account_id, ad_group_id, caminho, sha1)
+);
+"""
+
+# Status dos grupos de anúncios e dos criativos no diário
+RENDERIZADO = "renderizado"
+ENVIADO = "enviado"
+ERRO = "erro"
+CONCLUIDO = "concluido"
+
+
+def sha1_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def impressao_selecao(pares):
+    """Identifica uma seleção de grupos de anúncios ((account_id, ad_group_id)), sem depender da ordem."""
+    return hashlib.sha1("\n".join(sorted(f"{conta}/{grupo}" for conta, grupo in set(pares))).encode()).hexdigest()
+
+
+class JobJournal:
+    """Diário em SQLite do andamento de cada (conta, grupo, criativo), por execução.
+
+    Cada execução registra a seleção de grupos que processa. Cada criativo
+    passa por renderizado -> enviado (com o resource_name devolvido pelo
+    Google Ads) ou erro; o grupo fica concluído quando todos os seus
+    criativos foram enviados, e a execução termina quando todos os seus
+    grupos foram concluídos. Como tudo é gravado assim que acontece, uma
+    execução interrompida (ou com falhas) pode ser retomada: grupos
+    concluídos nela são pulados e criativos já renderizados nela (e ainda
+    iguais no disco) são enviados sem renderizar de novo. O que outras
+    execuções concluíram não conta.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.JOURNAL_FILE
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < VERSAO_ESQUEMA:
+            # Diários sem execuções não servem para retomar nada
+            self._conn.executescript("DROP TABLE IF EXISTS grupos; DROP TABLE IF EXISTS criativos;")
+        self._conn.executescript(ESQUEMA)
+        self._conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+
+    def _executar(self, sql, parametros=()):
+        with self._lock:
+            return self._conn.execute(sql, parametros).fetchall()
+
+    def _transacao(self, comandos):
+        """Executa [(sql, linhas)] numa única transação."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, linhas in comandos:
+                    self._conn.executemany(sql, linhas)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def iniciar_execucao(self, pares, retomar=False):
+        """Abre uma execução para a seleção de grupos; retorna (id, retomada).
+
+        Com retomar, reabre a última execução da mesma seleção que ainda não
+        terminou, se houver; senão (ou sem retomar) cria uma nova.
+        """
+        selecao = impressao_selecao(pares)
+        with self._lock:
+            if retomar:
+                linha = self._conn.execute(
+                    "SELECT id FROM execucoes WHERE selecao = ? AND terminada_em IS NULL ORDER BY id DESC LIMIT 1",
+                    (selecao,)
+                ).fetchone()
+                if linha:
+                    return linha[0], True
+            cursor = self._conn.execute(
+                "INSERT INTO execucoes (selecao, iniciada_em) VALUES (?, ?)", (selecao, time.time())
+            )
+            return cursor.lastrowid, False
+
+    def encerrar_execucao(self, execucao, pares):
+        """Marca a execução como terminada se todos os grupos (pares) foram concluídos nela; retorna se terminou."""
+        if not all(self.concluido(execucao, account_id, ad_group_id) for account_id, ad_group_id in pares):
+            return False
+        self._executar("UPDATE execucoes SET terminada_em = ? WHERE id = ?", (time.time(), execucao))
+        return True
+
+    def _status_grupo(self, execucao, account_id, ad_group_id, site, status, erro=None):
+        self._executar(
+            "INSERT INTO grupos (execucao, account_id, ad_group_id, site, status, erro, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (execucao, account_id, ad_group_id) DO UPDATE SET "
+            "site = COALESCE(excluded.site, site), status = excluded.status, erro = excluded.erro, atualizado_em = excluded.atualizado_em",
+            (execucao, account_id, ad_group_id, site, status, erro, time.time())
+        )
+
+    def registrar_renderizados(self, execucao, account_id, ad_group_id, site, caminhos):
+        """Grava os criativos gerados para o grupo (um novo render substitui os pendentes anteriores).
+
+        Criativos já enviados nunca são sobrescritos: o mesmo conteúdo no
+        mesmo caminho continua enviado, e conteúdo novo num caminho já usado
+        ganha uma linha própria (a chave inclui o sha1).
+        """
+        agora = time.time()
+        linhas = [(execucao, account_id, ad_group_id, caminho, sha1_arquivo(caminho), RENDERIZADO, agora) for caminho in caminhos]
+        self._transacao([
+            ("DELETE FROM criativos WHERE execucao = ? AND account_id = ? AND ad_group_id = ? AND status != ?",
+             [(execucao, account_id, ad_group_id, ENVIADO)]),
+            ("INSERT OR IGNORE INTO criativos (execucao, account_id, ad_group_id, caminho, sha1, status, atualizado_em) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?)", linhas),
+        ])
+        self._status_grupo(execucao, account_id, ad_group_id, site, RENDERIZADO)
+
+    def registrar_uploads(self, execucao, account_id, ad_group_id, resultados):
+        """Grava o resultado do upload (caminho -> {"resource_name", "error"}) e conclui o grupo se tudo foi enviado."""
+        agora = time.time()
+        self._transacao([(
+            "UPDATE criativos SET status = ?, resource_name = ?, erro = ?, atualizado_em = ? "
+            "WHERE execucao = ? AND account_id = ? AND ad_group_id = ? AND caminho = ? AND status != ?",
+            [
+                (ENVIADO if resultado["resource_name"] else ERRO, resultado["resource_name"], resultado["error"], agora,
+                 execucao, account_id, ad_group_id, caminho, ENVIADO)
+                for caminho, resultado in resultados.items()
+            ]
+        )])
+        if not self.pendentes(execucao, account_id, ad_group_id, verificar_disco=False):
+            self._status_grupo(execucao, account_id, ad_group_id, None, CONCLUIDO)
+
+    def registrar_erro(self, execucao, account_id, ad_group_id, site, erro):
+        """Grava uma falha do grupo antes do upload (ex.: logo não encontrada)."""
+        self._status_grupo(execucao, account_id, ad_group_id, site, ERRO, erro)
+
+    def concluido(self, execucao, account_id, ad_group_id):
+        linhas = self._executar(
+            "SELECT status FROM grupos WHERE execucao = ? AND account_id = ? AND ad_group_id = ?",
+            (execucao, account_id, ad_group_id)
+        )
+        return bool(linhas) and linhas[0][0] == CONCLUIDO
+
+    def pendentes(self, execucao, account_id, ad_group_id, verificar_disco=True):
+        """Criativos renderizados na execução e ainda não enviados.
+
+        Com verificar_disco, retorna None se algum deles sumiu ou mudou no
+        disco (aí o grupo precisa ser renderizado de novo).
+        """
+        linhas = self._executar(
+            "SELECT caminho, sha1 FROM criativos WHERE execucao = ? AND account_id = ? AND ad_group_id = ? AND status != ? "
+            "ORDER BY caminho",
+            (execucao, account_id, ad_group_id, ENVIADO)
+        )
+        if verificar_disco:
+            for caminho, sha1 in linhas:
+                if not os.path.exists(caminho) or sha1_arquivo(caminho) != sha1:
+                    return None
+        return [caminho for caminho, _ in linhas]
+
+    def enviados(self, execucao, account_id, ad_group_id):
+        """Criativos já enviados do grupo na execução: caminho -> resource_name (o mais recente por caminho)."""
+        linhas = self._executar(
+            "SELECT caminho, resource_name FROM criativos WHERE execucao = ? AND account_id = ? AND ad_group_id = ? AND status = ? "
+            "ORDER BY atualizado_em",
+            (execucao, account_id, ad_group_id, ENVIADO)
+        )
+        return dict(linhas)
+
+    def enviados_por_sha1(self, account_id, ad_group_id):
+        """Conteúdo dos criativos já enviados ao grupo, em qualquer execução: sha1 -> resource_name."""
+        linhas = self._executar(
+            "SELECT sha1, resource_name FROM criativos WHERE account_id = ? AND ad_group_id = ? AND status = ? AND sha1 IS NOT NULL",
+            (account_id, ad_group_id, ENVIADO)
+        )
+        return dict(linhas)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Retorna o JobJournal único do processo, ou None se JOURNAL_FILE estiver vazio."""
+    global _journal
+    if not config.JOURNAL_FILE:
+        return None
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = JobJournal()
+    return _journal
@@ -5,13 +5,11 @@ from datetime import datetime
 import pandas as pd
 from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload
-import io
-import time
 import argparse
-from PIL import Image, ImageSequence
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Try to import platform-specific notification libraries
 try:
@@ -28,11 +26,17 @@ except ImportError:
 
 # Import config
 from config import config, IDIOMAS_POR_PAIS
+from drive_client import get_drive_client
+from rate_limit import executar_com_limite
+from render import PERFIS_PNG, CriativoAcimaDoLimite, get_render_engine, preparar_logo
+from drive_cache import extensao_template, get_logo_catalog, get_file_cache, get_template_manifest, get_template_prober, listar_pasta
+from render_cache import checksum_logo, chave_render, get_prepared_templates, get_render_cache
+from pipeline import Etapa, EtapaFalhou, Job, Pipeline
+from async_api import get_async_api
+from journal import get_journal
+from batch import SAIDA_ERRO_SPEC, SAIDA_FALHAS, SAIDA_OK, SpecInvalida, carregar_spec
 
 # ------------------------ CONFIGURAÇÕES GERAIS ------------------------
-MAX_REQUESTS = config.MAX_REQUESTS
-request_count = 0  # Contador de requisições feitas
-
 PASTA_OUTPUT = config.OUTPUT_DIR
 TEMPLATES_DIR = config.TEMPLATES_DIR
 LOGOS_DIR = config.LOGOS_DIR
@@ -67,9 +71,6 @@ def create_credentials_files():
     except Exception as e:
         print(f"❌ Error creating credential files: {e}")
 
-# Create credential files if environment variables are available
-create_credentials_files()
-
 # Use IDIOMAS_POR_PAIS from config
 
 
@@ -79,37 +80,11 @@ SHEET_RANGE = config.SHEET_RANGE
 
 # ------------------------ FUNÇÕES DO GOOGLE DRIVE ------------------------
 def get_drive_service():
-    """Inicializa e retorna o serviço do Google Drive."""
+    """Retorna o serviço do Google Drive compartilhado pelo processo."""
     try:
-        # Verifica se o arquivo existe, se não, cria a partir da variável de ambiente
-        if not os.path.exists("drive_credentials.json") and config.DRIVE_CREDENTIALS_CONTENT:
-            print("📝 Criando drive_credentials.json a partir da variável de ambiente...")
-            with open("drive_credentials.json", "w") as f:
-                f.write(config.DRIVE_CREDENTIALS_CONTENT)
-            print("✅ Arquivo drive_credentials.json criado")
-        
-        # Verifica se o arquivo existe
-        if not os.path.exists("drive_credentials.json"):
-            raise Exception("Arquivo drive_credentials.json não encontrado")
-        
-        # Lê e valida o conteúdo do arquivo
-        with open("drive_credentials.json", "r") as f:
-            content = f.read()
-            if not content.strip():
-                raise Exception("Arquivo drive_credentials.json está vazio")
-        
-        print("📋 Usando arquivo drive_credentials.json existente")
-        
-        SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-        creds = service_account.Credentials.from_service_account_file("drive_credentials.json", scopes=SCOPES)
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Testa a conexão
-        print("🔍 Testando conexão com Google Drive...")
-        service.files().list(pageSize=1).execute()
-        print("✅ Conexão com Google Drive estabelecida")
-        
-        return service
+        client = get_drive_client()
+        client.health_check()
+        return client.service
     except Exception as e:
         print(f"❌ Erro ao inicializar o serviço do Drive: {str(e)}")
         if "credentials" in str(e).lower():
@@ -131,25 +106,35 @@ def test_drive_access():
             print("❌ Variável DRIVE_CREDENTIALS não encontrada")
             return False
         
+        client = get_drive_client()
+        client.health_check(force=True)
         service = get_drive_service()
-        print("✅ Conexão com Google Drive estabelecida")
         
         # Lista todas as pastas que a conta tem acesso
         print("📁 Testando acesso às pastas...")
         
+        # As duas pastas e a listagem de logos vão numa única chamada batch
+        logo_folder, logo_files, template_folder = client.execute_batch([
+            service.files().get(fileId=LOGOS_DRIVE_FOLDER_ID),
+            service.files().list(
+                q=f"'{LOGOS_DRIVE_FOLDER_ID}' in parents and trashed = false",
+                fields="files(id, name, mimeType)",
+                pageSize=50
+            ),
+            service.files().get(fileId=TEMPLATES_DRIVE_FOLDER_ID),
+        ])
+        
         # Testa acesso à pasta de logos
         try:
-            logo_folder = service.files().get(fileId=LOGOS_DRIVE_FOLDER_ID).execute()
-            print(f"✅ Pasta de logos encontrada: {logo_folder['name']}")
+            if logo_folder.error is not None:
+                raise logo_folder.error
+            print(f"✅ Pasta de logos encontrada: {logo_folder.response['name']}")
             
             # Lista arquivos na pasta de logos
-            logo_files = service.files().list(
-                q=f"'{LOGOS_DRIVE_FOLDER_ID}' in parents and trashed = false",
-                fields="files(id, name, mimeType)",
-                pageSize=50
-            ).execute()
+            if logo_files.error is not None:
+                raise logo_files.error
             
-            files = logo_files.get('files', [])
+            files = logo_files.response.get('files', [])
             print(f"📋 Arquivos na pasta de logos ({len(files)} encontrados):")
             for file in files:
                 print(f"  - {file['name']} ({file['mimeType']})")
@@ -169,11 +154,10 @@ def test_drive_access():
             print("3. A pasta não foi movida ou deletada")
         
         # Testa acesso à pasta de templates
-        try:
-            template_folder = service.files().get(fileId=TEMPLATES_DRIVE_FOLDER_ID).execute()
-            print(f"✅ Pasta de templates encontrada: {template_folder['name']}")
-        except Exception as e:
-            print(f"❌ Erro ao acessar pasta de templates: {e}")
+        if template_folder.error is None:
+            print(f"✅ Pasta de templates encontrada: {template_folder.response['name']}")
+        else:
+            print(f"❌ Erro ao acessar pasta de templates: {template_folder.error}")
             
     except Exception as e:
         print(f"❌ Erro geral ao testar acesso: {e}")
@@ -181,23 +165,13 @@ def test_drive_access():
     
     return True
 
-def list_all_logos():
-    """Lista todas as logos disponíveis no Google Drive, com paginação."""
+def list_all_logos(refresh=False):
+    """Lista todas as logos disponíveis no Google Drive (a partir do catálogo de logos)."""
     try:
-        service = get_drive_service()
-        all_files = []
-        page_token = None
-        while True:
-            response = service.files().list(
-                q=f"'{LOGOS_DRIVE_FOLDER_ID}' in parents and mimeType = 'image/png' and trashed = false",
-                fields="nextPageToken, files(id, name)",
-                pageSize=1000,  # máximo permitido pela API
-                pageToken=page_token
-            ).execute()
-            all_files.extend(response.get('files', []))
-            page_token = response.get('nextPageToken', None)
-            if not page_token:
-                break
+        catalog = get_logo_catalog()
+        if refresh:
+            catalog.refresh()
+        all_files = sorted(catalog.files(), key=lambda f: f['name'].lower())
         print(f"🎨 Todas as logos disponíveis ({len(all_files)}):")
         for file in all_files:
             print(f"  - {file['name']}")
@@ -208,143 +182,72 @@ def list_all_logos():
 
 def list_files_in_folder(folder_id):
     """Lista todos os arquivos em uma pasta do Google Drive."""
-    service = get_drive_service()
-    results = service.files().list(
-        q=f"'{folder_id}' in parents and trashed = false",
-        fields="files(id, name, mimeType)",
-        pageSize=1000
-    ).execute()
-    return results.get('files', [])
-
-def download_file(file_id, output_path):
-    """Baixa um arquivo do Google Drive para o caminho especificado."""
-    service = get_drive_service()
-    request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-    
-    # Garante que o diretório pai existe
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    with open(output_path, 'wb') as f:
-        f.write(fh.getvalue())
+    return listar_pasta(folder_id)
 
 def buscar_logo_por_site(site):
-    """Busca a logo do site no Google Drive usando paginação para garantir que encontra qualquer logo."""
+    """Busca a logo do site no catálogo de logos do Google Drive e garante uma cópia local."""
     try:
-        # Primeiro testa o acesso ao Drive
-        if not test_drive_access():
-            print("❌ Não foi possível conectar ao Google Drive")
-            return None
-        
-        service = get_drive_service()
         site = site.strip()
-        query = f"'{LOGOS_DRIVE_FOLDER_ID}' in parents and mimeType = 'image/png' and trashed = false"
-        all_files = []
-        page_token = None
-        while True:
-            response = service.files().list(
-                q=query,
-                fields="nextPageToken, files(id, name)",
-                pageSize=1000,
-                pageToken=page_token
-            ).execute()
-            all_files.extend(response.get('files', []))
-            page_token = response.get('nextPageToken', None)
-            if not page_token:
-                break
         print(f"🔍 Procurando logo para: '{site}'")
-        print(f"📁 Arquivos encontrados na pasta de logos: {[f['name'] for f in all_files]}")
-        matching_file = None
-        expected_name = f"{site}.png"
-        for file in all_files:
-            file_name_lower = file['name'].lower()
-            expected_name_lower = expected_name.lower()
-            if file_name_lower == expected_name_lower:
-                matching_file = file
-                print(f"✅ Logo encontrada: {file['name']}")
-                break
-            elif file_name_lower.replace('.png', '') == site.lower():
-                matching_file = file
-                print(f"✅ Logo encontrada (correspondência parcial): {file['name']}")
-                break
+        matching_file = get_logo_catalog().lookup(site)
         if not matching_file:
             print(f"❌ Logo não encontrada para '{site}'")
-            print(f"⚠️ Procurando por: '{expected_name}'")
-            print("📋 Logos disponíveis:")
-            for file in all_files:
-                print(f"  - {file['name']}")
+            print(f"⚠️ Procurando por: '{site}.png'")
+            return None
+        print(f"✅ Logo encontrada: {matching_file['name']}")
+        try:
+            # O cache baixa de novo se a logo mudou no Drive (md5Checksum/modifiedTime)
+            logo_path = get_file_cache().get_file(matching_file)
+        except Exception as e:
+            print(f"❌ Erro ao baixar a logo: {str(e)}")
             return None
-        os.makedirs(LOGOS_DIR, exist_ok=True)
-        logo_path = os.path.join(LOGOS_DIR, f"{site}.png")
-        if not os.path.exists(logo_path):
-            try:
-                download_file(matching_file['id'], logo_path)
-                print(f"📥 Logo baixada: {logo_path}")
-            except Exception as e:
-                print(f"❌ Erro ao baixar a logo: {str(e)}")
-                return None
         return logo_path
     except Exception as e:
         print(f"❌ Erro geral ao buscar logo: {str(e)}")
         return None
 
 def get_templates_for_language(idioma, tag=None):
-    """Obtém a lista de templates para um idioma específico do Google Drive."""
-    service = get_drive_service()
-    
-    # Se uma tag foi especificada, procura diretamente na pasta da tag
-    if tag:
-        # Procura a pasta da tag no Google Drive
-        tag_results = service.files().list(
-            q=f"name = '{tag}' and '{TEMPLATES_DRIVE_FOLDER_ID}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false",
-            fields="files(id, name)",
-            pageSize=1
-        ).execute()
-        tag_folders = tag_results.get('files', [])
-        
-        if tag_folders:
-            # Usa a pasta da tag se encontrada
-            parent_id = tag_folders[0]['id']
-        else:
-            print(f"⚠️ Pasta {tag} não encontrada no Drive.")
-            return []
-    else:
-        # Procura a pasta do idioma no Google Drive
-        results = service.files().list(
-            q=f"name = '{idioma}' and '{TEMPLATES_DRIVE_FOLDER_ID}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false",
-            fields="files(id, name)",
-            pageSize=1
-        ).execute()
-        folders = results.get('files', [])
-        
-        if not folders:
-            print(f"⚠️ Pasta {idioma} não encontrada no Drive.")
-            return []
-        
-        parent_id = folders[0]['id']
-    
-    # Lista os arquivos na pasta selecionada
-    templates = service.files().list(
-        q=f"'{parent_id}' in parents and (mimeType = 'image/png' or mimeType = 'image/gif') and trashed = false",
-        fields="files(id, name, mimeType)",
-        pageSize=1000
-    ).execute().get('files', [])
-    
-    # Retorna lista de tuplas (id, nome) dos templates
-    return [(template['id'], template['name']) for template in templates]
+    """Obtém a lista de templates (Template) para um idioma ou tag a partir do manifesto de templates."""
+    # Se uma tag foi especificada, usa diretamente a pasta da tag
+    pasta = tag if tag else idioma
+    templates = get_template_manifest().get(pasta)
+    if templates is None:
+        print(f"⚠️ Pasta {pasta} não encontrada no Drive.")
+        return []
+    return templates
+
+def template_adequado(probe):
+    """Um template serve se o cabeçalho pôde ser lido e a proporção é próxima da de DIMENSOES."""
+    if probe is None or not probe.width or not probe.height:
+        return False
+    proporcao = (probe.width / probe.height) / (DIMENSOES[0] / DIMENSOES[1])
+    return abs(proporcao - 1) <= config.TEMPLATE_MAX_ASPECT_DIFF
+
+def selecionar_templates(template_list, quantidade):
+    """Sorteia quantidade templates da lista.
+
+    Com TEMPLATE_PROBE ativo, sonda só o cabeçalho dos sorteados (sem baixar
+    o arquivo inteiro) e troca os inadequados pelos próximos da fila.
+    """
+    if not config.TEMPLATE_PROBE:
+        return random.sample(template_list, quantidade)
+    fila = random.sample(template_list, len(template_list))
+    prober = get_template_prober()
+    selecionados = []
+    while fila and len(selecionados) < quantidade:
+        candidatos, fila = fila[:quantidade - len(selecionados)], fila[quantidade - len(selecionados):]
+        for template, probe in zip(candidatos, prober.probe_many(candidatos)):
+            if template_adequado(probe):
+                selecionados.append(template)
+            else:
+                print(f"⏭️ Template ignorado: {template.name}" + (f" ({probe.width}x{probe.height})" if probe else ""))
+    return selecionados
 
 # ------------------------ FUNÇÃO DE LEITURA DA PLANILHA ------------------------
 def ler_planilha():
     expected_columns = ["Site", "ID da Conta", "Nome da Conta", "ID do Grupo de Anúncios", "Campanha", "País"]
-    SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-    creds = service_account.Credentials.from_service_account_file("sheets_credentials.json", scopes=SCOPES)
-    service = build("sheets", "v4", credentials=creds)
     try:
-        result = service.spreadsheets().values().get(spreadsheetId=SHEET_ID, range=SHEET_RANGE).execute()
+        result = asyncio.run(get_async_api().sheets_valores(SHEET_ID, SHEET_RANGE))
     except Exception as e:
         print(f"Erro ao ler a planilha: {e}")
         return None
@@ -381,16 +284,11 @@ def gerar_nomes_criativos(quantidade):
         nomes.append(f"{data_str}{sufixo}")
     return nomes
 
-def salvar_sem_metadados(image, output_path, file_format="PNG"):
-    image = image.resize(DIMENSOES)
-    if file_format.upper() == "GIF":
-        image.save(output_path, format="GIF", optimize=True)
-    else:
-        image = image.convert("RGB")
-        image.save(output_path, format="PNG", optimize=True, compress_level=0)
-
-def gerar_criativos(nome_site, idioma, quantidade, logo_path, templates_especificos=None, tag=None):
-    """Gera criativos usando templates do Google Drive."""
+def gerar_criativos(nome_site, idioma, quantidade, logo_path, templates_especificos=None, tag=None, perfil_png=None):
+    """Gera criativos usando templates do Google Drive.
+    
+    perfil_png escolhe o perfil do encoder PNG (fast, balanced, smallest); o padrão é PNG_ENCODER_PROFILE.
+    """
     template_list = get_templates_for_language(idioma, tag)
     if not template_list:
         print(f"⚠️ Nenhuma pasta encontrada para o idioma: {idioma}" + (f" e tag: {tag}" if tag else ""))
@@ -404,11 +302,11 @@ def gerar_criativos(nome_site, idioma, quantidade, logo_path, templates_especifi
     if templates_especificos:
         print(f"Filtrando templates. Procurando por: {templates_especificos}")
         filtered_templates = []
-        for template_id, template_name in template_list:
+        for template in template_list:
             for template_spec in templates_especificos:
-                if template_spec.lower() in template_name.lower():
-                    filtered_templates.append((template_id, template_name))
-                    print(f"Template encontrado: {template_name}")
+                if template_spec.lower() in template.name.lower():
+                    filtered_templates.append(template)
+                    print(f"Template encontrado: {template.name}")
                     break
         
         if not filtered_templates:
@@ -429,176 +327,584 @@ def gerar_criativos(nome_site, idioma, quantidade, logo_path, templates_especifi
     
     # Gera nomes para os criativos
     nomes = gerar_nomes_criativos(quantidade)
-    criativos = []
     
     # Seleciona uma amostra aleatória dos templates
-    selected_templates = random.sample(template_list, quantidade)
-    
-    # Baixa e processa cada template
-    for i, (template_id, template_name) in enumerate(selected_templates):
-        print(f"Processando template: {template_name}")
-        # Baixa o template temporariamente
-        temp_template_path = os.path.join(pasta_destino, f"temp_template_{i}.png")
-        download_file(template_id, temp_template_path)
-        
-        # Processa o template
-        ext = os.path.splitext(temp_template_path)[1].lower()
-        output_file = os.path.join(pasta_destino, f"{nomes[i]}{ext}")
-        logo = Image.open(logo_path).convert("RGBA").resize(LOGO_SIZE)
-        posicao = (DIMENSOES[0] - LOGO_SIZE[0] - 10, DIMENSOES[1] - LOGO_SIZE[1] - 10)
-        
-        if ext == ".gif":
-            template = Image.open(temp_template_path)
-            frames = []
-            durations = []
-            transparency = template.info.get('transparency', 0)
-            loop = template.info.get('loop', 0)
-
-            for frame in ImageSequence.Iterator(template):
-                duration = frame.info.get("duration", 100)
-                # Sempre trabalhe em uma cópia nova do frame
-                frame_rgba = frame.convert("RGBA").resize(DIMENSOES, Image.Resampling.LANCZOS)
-                frame_with_logo = frame_rgba.copy()
-                frame_with_logo.paste(logo, posicao, logo)
-                frame_p = frame_with_logo.convert("P", palette=Image.ADAPTIVE)
-                frames.append(frame_p)
-                durations.append(duration)
-
-            frames[0].save(
-                output_file,
-                save_all=True,
-                append_images=frames[1:],
-                duration=durations,
-                loop=loop,
-                optimize=False,
-                disposal=2,  # ESSENCIAL para não empilhar a logo!
-                transparency=transparency
+    selected_templates = selecionar_templates(template_list, quantidade)
+    quantidade = len(selected_templates)
+    if quantidade == 0:
+        print("⚠️ Nenhum template adequado encontrado.")
+        return []
+    
+    # GIFs seguem o caminho animado; o formato vem do mimeType do manifesto
+    extensoes = [extensao_template(template) for template in selected_templates]
+    perfil = perfil_png or config.PNG_ENCODER_PROFILE
+    
+    # Criativos já renderizados antes (mesmo template, logo, dimensões e perfil) saem do cache
+    render_cache = get_render_cache()
+    logo_checksum = checksum_logo(logo_path)
+    chaves = [
+        chave_render(template.checksum or template.modified_time, logo_checksum, DIMENSOES, LOGO_SIZE, ext,
+                     "gif" if ext == ".gif" else perfil)
+        for template, ext in zip(selected_templates, extensoes)
+    ]
+    prontos = {}
+    for i, chave in enumerate(chaves):
+        data = render_cache.get(chave)
+        if data is not None:
+            prontos[i] = data
+    
+    # Baixa os templates restantes em paralelo e envia cada um para renderização assim que chega
+    logo = preparar_logo(logo_path, LOGO_SIZE, DIMENSOES)
+    engine = get_render_engine()
+    em_processo = quantidade - len(prontos) < config.RENDER_POOL_MIN_JOBS
+    renders = {}
+    # Templates já redimensionados para DIMENSOES: a renderização só cola a logo e codifica
+    prepared_templates = get_prepared_templates()
+    pendentes = [i for i in range(quantidade) if i not in prontos]
+    workers = max(1, min(config.DOWNLOAD_WORKERS, len(pendentes)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloads = {
+            executor.submit(prepared_templates.get_bytes, selected_templates[i], DIMENSOES, em_processo): i
+            for i in pendentes
+        }
+        for future in as_completed(downloads):
+            i = downloads[future]
+            print(f"Processando template: {selected_templates[i].name}")
+            # Sites que usam o mesmo template podem ser compostos num só job do pool
+            template = selected_templates[i]
+            renders[i] = engine.submit(
+                future.result(), logo, DIMENSOES, extensoes[i], in_process=em_processo, perfil=perfil,
+                chave_template=(template.id, template.checksum or template.modified_time)
             )
+    
+    # Grava os criativos na ordem dos nomes gerados
+    criativos = []
+    for i in range(quantidade):
+        output_file = os.path.join(pasta_destino, f"{nomes[i]}{extensoes[i]}")
+        if i in prontos:
+            data = prontos[i]
         else:
-            template = Image.open(temp_template_path).resize(DIMENSOES)
-            template.paste(logo, posicao, logo)
-            salvar_sem_metadados(template, output_file, "PNG")
-        
-        # Remove o template temporário
-        os.remove(temp_template_path)
+            try:
+                data = renders[i].result()
+            except CriativoAcimaDoLimite as e:
+                # Falha local: não vale gastar upload com um arquivo que o Google Ads vai recusar
+                print(f"❌ Criativo {nomes[i]} descartado, acima do limite de tamanho: {e}")
+                continue
+            render_cache.put(chaves[i], data)
+        with open(output_file, "wb") as f:
+            f.write(data)
         criativos.append(output_file)
     
     return criativos
 
 def fazer_requisicao_liberada(func, *args, **kwargs):
-    global request_count
-    if request_count >= MAX_REQUESTS:
-        print(f"Limite de requisições ({MAX_REQUESTS}) atingido. Aguardando reinício...")
-        time.sleep(3600)
-        request_count = 0
-    try:
-        response = func(*args, **kwargs)
-        request_count += 1
-        return response
-    except Exception as e:
-        print(f"Erro ao fazer a requisição: {e}")
-        return None
+    """Executa uma requisição ao Google Ads respeitando o limite de requisições e repetindo erros transitórios."""
+    return executar_com_limite("ads", func, *args, **kwargs)
 
-def get_existing_creatives(client, account_id, ad_group_id):
-    google_ads_service = client.get_service("GoogleAdsService")
-    query = f"""
-        SELECT ad_group_ad.ad.final_urls 
-        FROM ad_group_ad 
-        WHERE ad_group_ad.ad_group = 'customers/{account_id}/adGroups/{ad_group_id}' 
-        AND ad_group_ad.status = 'ENABLED'
+async def consultar_grupos_async(client, pares, campos, filtro, processar_linha):
+    """Roda uma consulta GAQL em ad_group_ad para vários grupos de anúncios.
+
+    Agrupa os pares (account_id, ad_group_id) por conta e faz uma consulta
+    por conta (em blocos de ADS_QUERY_CHUNK_SIZE grupos), em vez de uma por
+    grupo. As consultas de todas as contas saem ao mesmo tempo pela AsyncApi,
+    dentro do limite de requisições do Google Ads. processar_linha(account_id,
+    ad_group_id, row) é chamada para cada linha retornada. Retorna
+    (por_conta, falhas): os pares consultados, já normalizados e sem
+    repetição, agrupados por conta, e o conjunto dos pares cuja consulta falhou.
     """
-    try:
-        response = fazer_requisicao_liberada(google_ads_service.search, customer_id=account_id, query=query)
+    api = get_async_api()
+    por_conta = {}
+    for account_id, ad_group_id in pares:
+        por_conta.setdefault(str(account_id), []).append(str(ad_group_id))
+    
+    consultas = []
+    falhas = set()
+    for account_id, ad_group_ids in por_conta.items():
+        por_conta[account_id] = ad_group_ids = list(dict.fromkeys(ad_group_ids))
+        for start in range(0, len(ad_group_ids), config.ADS_QUERY_CHUNK_SIZE):
+            consultas.append((account_id, ad_group_ids[start:start + config.ADS_QUERY_CHUNK_SIZE]))
+    
+    async def consultar(account_id, chunk):
+        recursos = ", ".join(f"'customers/{account_id}/adGroups/{ad_group_id}'" for ad_group_id in chunk)
+        query = f"""
+            SELECT ad_group_ad.ad_group, {campos} 
+            FROM ad_group_ad 
+            WHERE ad_group_ad.ad_group IN ({recursos}) 
+            AND {filtro}
+        """
+        try:
+            response = await api.ads_search(client, account_id, query)
+        except Exception as ex:
+            print(f"❌ Erro ao buscar criativos existentes da conta {account_id}: {ex}")
+            falhas.update((account_id, ad_group_id) for ad_group_id in chunk)
+            return
         for row in response:
-            final_urls = row.ad_group_ad.ad.final_urls
-            if final_urls:
-                return final_urls[0]
-        return None
-    except Exception as ex:
-        print(f"❌ Erro ao buscar criativos existentes: {ex}")
+            processar_linha(account_id, row.ad_group_ad.ad_group.split("/")[-1], row)
+    
+    await asyncio.gather(*(consultar(account_id, chunk) for account_id, chunk in consultas))
+    return por_conta, falhas
+
+async def buscar_urls_finais_async(client, pares):
+    """Busca a URL final dos criativos ativos de vários grupos de anúncios.
+
+    Uma consulta por conta (consultar_grupos_async), em vez de uma por grupo.
+    Retorna um dict (account_id, ad_group_id) -> URL final, ou None se o grupo
+    não tiver criativo ativo com URL.
+    """
+    urls = {}
+    
+    def processar(account_id, ad_group_id, row):
+        final_urls = row.ad_group_ad.ad.final_urls
+        if final_urls and not urls.get((account_id, ad_group_id)):
+            urls[(account_id, ad_group_id)] = final_urls[0]
+    
+    # Grupos cuja consulta falhou ficam sem URL (e falham na etapa url)
+    por_conta, _ = await consultar_grupos_async(
+        client, pares, "ad_group_ad.ad.final_urls", "ad_group_ad.status = 'ENABLED'", processar
+    )
+    for account_id, ad_group_ids in por_conta.items():
+        for ad_group_id in ad_group_ids:
+            urls.setdefault((account_id, ad_group_id), None)
+    return urls
+
+def buscar_urls_finais(client, pares):
+    """Versão síncrona de buscar_urls_finais_async (para quem não está num event loop)."""
+    return asyncio.run(buscar_urls_finais_async(client, pares))
+
+async def buscar_anuncios_existentes_async(client, pares):
+    """Busca os anúncios de imagem (não removidos) de vários grupos, em lote.
+
+    Retorna um dict (account_id, ad_group_id) -> {impressão do conteúdo
+    (sufixo do ad.name, ver nome_anuncio): resource_name}, com um dict vazio
+    para grupos sem anúncios de imagem e None para grupos cuja consulta
+    falhou (não dá para saber o que já existe neles).
+    """
+    existentes = {}
+    
+    def processar(account_id, ad_group_id, row):
+        impressao = row.ad_group_ad.ad.name.rsplit("-", 1)[-1]
+        existentes.setdefault((account_id, ad_group_id), {})[impressao] = row.ad_group_ad.resource_name
+    
+    por_conta, falhas = await consultar_grupos_async(
+        client, pares, "ad_group_ad.ad.name, ad_group_ad.resource_name",
+        "ad_group_ad.status != 'REMOVED' AND ad_group_ad.ad.type = 'IMAGE_AD'", processar
+    )
+    for account_id, ad_group_ids in por_conta.items():
+        for ad_group_id in ad_group_ids:
+            existentes.setdefault((account_id, ad_group_id), {})
+    for par in falhas:
+        existentes[par] = None
+    return existentes
+
+def buscar_anuncios_existentes(client, pares):
+    """Versão síncrona de buscar_anuncios_existentes_async."""
+    return asyncio.run(buscar_anuncios_existentes_async(client, pares))
+
+def impressao_conteudo(image_data):
+    """Início do sha1 do conteúdo do criativo, usado como sufixo do ad.name."""
+    return hashlib.sha1(image_data).hexdigest()[:10]
+
+def nome_anuncio(creative_path, image_data):
+    """ad.name do criativo: nome do arquivo + "-" + impressao_conteudo.
+
+    Os nomes dos arquivos (data + letra, sorteada a cada execução) não
+    identificam o criativo; o sufixo identifica o conteúdo enviado.
+    """
+    nome = os.path.splitext(os.path.basename(creative_path))[0]
+    return f"{nome}-{impressao_conteudo(image_data)}"
+
+def anuncio_duplicado(account_id, ad_group_id, creative_path, image_data, existentes):
+    """Retorna o resource_name do anúncio que já existe no grupo para este criativo, ou None.
+
+    Um criativo é duplicado se o grupo já tem um anúncio de imagem cujo
+    ad.name termina com a impressão do mesmo conteúdo, qualquer que seja o
+    nome do arquivo, ou se o diário registra um upload do mesmo conteúdo
+    (sha1) para o grupo e esse anúncio ainda existe (anúncios com nomes sem
+    a impressão).
+    """
+    anuncios = existentes.get((str(account_id), str(ad_group_id))) or {}
+    if not anuncios:
         return None
+    impressao = impressao_conteudo(image_data)
+    if impressao in anuncios:
+        return anuncios[impressao]
+    journal = get_journal()
+    if journal is not None:
+        resource_name = journal.enviados_por_sha1(account_id, ad_group_id).get(hashlib.sha1(image_data).hexdigest())
+        if resource_name in anuncios.values():
+            return resource_name
+    return None
+
+def get_existing_creatives(client, account_id, ad_group_id):
+    return buscar_urls_finais(client, [(account_id, ad_group_id)]).get((str(account_id), str(ad_group_id)))
+
+def criar_operacao_criativo(client, account_id, ad_group_id, creative_path, final_url, image_data=None):
+    """Monta a AdGroupAdOperation de um criativo de imagem."""
+    if image_data is None:
+        with open(creative_path, "rb") as f:
+            image_data = f.read()
+    
+    ad_operation = client.get_type("AdGroupAdOperation")
+    ad = ad_operation.create
+    ad.ad_group = f"customers/{account_id}/adGroups/{ad_group_id}"
+    ad.status = client.enums.AdGroupAdStatusEnum.ENABLED
+    
+    # Configura o anúncio de imagem
+    image_ad = ad.ad.image_ad
+    image_ad.data = image_data
+    
+    # Define o tipo MIME
+    ext = os.path.splitext(creative_path)[1].lower()
+    if ext == ".gif":
+        image_ad.mime_type = client.enums.MimeTypeEnum.IMAGE_GIF
+    else:
+        image_ad.mime_type = client.enums.MimeTypeEnum.IMAGE_PNG
+    
+    # Configura URLs
+    ad.ad.final_urls.append(final_url)
+    ad.ad.display_url = final_url.split("://")[-1]
+    ad.ad.name = nome_anuncio(creative_path, image_data)
+    return ad_operation
+
+def _erros_partial_failure(client, response):
+    """Mapeia os erros de partial_failure de uma resposta para o índice da operação."""
+    partial_failure = getattr(response, "partial_failure_error", None)
+    if not partial_failure or partial_failure.code == 0:
+        return {}
+    failure_type = type(client.get_type("GoogleAdsFailure"))
+    erros = {}
+    for detail in partial_failure.details:
+        failure = failure_type.deserialize(detail.value)
+        for error in failure.errors:
+            elements = error.location.field_path_elements
+            if elements and elements[0].field_name == "operations":
+                erros.setdefault(elements[0].index, []).append(error.message)
+    return erros
+
+async def enviar_operacoes_async(client, account_id, operacoes):
+    """Envia AdGroupAdOperations de uma conta em poucos mutates, com partial_failure.
+    
+    `operacoes` é uma lista de (operação, tamanho em bytes). As operações são
+    agrupadas em lotes de até ADS_MUTATE_MAX_OPERATIONS operações e
+    ADS_MUTATE_MAX_BYTES bytes, enviados um após o outro pela AsyncApi
+    (ads_mutate_ad_group_ads, que só repete recusas por limite de
+    requisições). Retorna uma lista, na mesma ordem, de (resource_name,
+    erro) — um dos dois é None.
+    """
+    api = get_async_api()
+    resultados = [None] * len(operacoes)
+    
+    lotes = []
+    lote = []
+    lote_bytes = 0
+    for index, (operacao, tamanho) in enumerate(operacoes):
+        if lote and (len(lote) >= config.ADS_MUTATE_MAX_OPERATIONS or lote_bytes + tamanho > config.ADS_MUTATE_MAX_BYTES):
+            lotes.append(lote)
+            lote, lote_bytes = [], 0
+        lote.append(index)
+        lote_bytes += tamanho
+    if lote:
+        lotes.append(lote)
+    
+    for lote in lotes:
+        try:
+            response = await api.ads_mutate_ad_group_ads(client, account_id, [operacoes[index][0] for index in lote])
+        except Exception as ex:
+            # Falha do mutate inteiro (ex.: erro de autenticação): todas as operações do lote falham
+            for index in lote:
+                resultados[index] = (None, str(ex))
+            continue
+        erros = _erros_partial_failure(client, response)
+        for posicao, index in enumerate(lote):
+            if posicao in erros:
+                resultados[index] = (None, "; ".join(erros[posicao]))
+            elif posicao < len(response.results) and response.results[posicao].resource_name:
+                resultados[index] = (response.results[posicao].resource_name, None)
+            else:
+                resultados[index] = (None, "Resposta vazia do Google Ads")
+    return resultados
 
-def upload_creatives(client, account_id, ad_group_id, creative_paths, final_url):
+def enviar_operacoes(client, account_id, operacoes):
+    """Versão síncrona de enviar_operacoes_async."""
+    return asyncio.run(enviar_operacoes_async(client, account_id, operacoes))
+
+def upload_creatives_em_lote(client, account_id, itens, existentes=None):
+    """Envia os criativos de vários grupos de anúncios de uma mesma conta em mutates agrupados.
+    
+    `itens` é uma lista de (ad_group_id, creative_paths, final_url). Retorna um
+    dict caminho do criativo -> {"resource_name": ..., "error": ..., "duplicado": ...}.
+    
+    Com UPLOAD_SKIP_DUPLICATES, criativos que já estão no grupo (anuncio_duplicado)
+    não viram operação: voltam com o resource_name existente e duplicado=True.
+    `existentes` é o resultado de buscar_anuncios_existentes; se não vier, é
+    buscado aqui, numa consulta para todos os grupos dos itens. Se a consulta
+    de um grupo falhou, nada é enviado a ele (não dá para evitar duplicados).
+    """
+    if config.UPLOAD_SKIP_DUPLICATES and existentes is None:
+        existentes = buscar_anuncios_existentes(client, [(account_id, ad_group_id) for ad_group_id, _, _ in itens])
+    resultados = {}
+    operacoes = []
+    caminhos = []
+    for ad_group_id, creative_paths, final_url in itens:
+        if config.UPLOAD_SKIP_DUPLICATES and existentes.get((str(account_id), str(ad_group_id)), {}) is None:
+            for creative_path in creative_paths:
+                resultados[creative_path] = {"resource_name": None, "error": "Não foi possível consultar os anúncios existentes do grupo; upload adiado para não duplicar"}
+            continue
+        for creative_path in creative_paths:
+            if not os.path.exists(creative_path):
+                resultados[creative_path] = {"resource_name": None, "error": f"Arquivo não encontrado: {creative_path}"}
+                continue
+            try:
+                with open(creative_path, "rb") as f:
+                    image_data = f.read()
+                if len(image_data) > config.MAX_CREATIVE_BYTES:
+                    resultados[creative_path] = {"resource_name": None, "error": f"Arquivo acima do limite de {config.MAX_CREATIVE_BYTES} bytes ({len(image_data)} bytes)"}
+                    continue
+                if config.UPLOAD_SKIP_DUPLICATES:
+                    resource_name = anuncio_duplicado(account_id, ad_group_id, creative_path, image_data, existentes)
+                    if resource_name:
+                        resultados[creative_path] = {"resource_name": resource_name, "error": None, "duplicado": True}
+                        continue
+                operacao = criar_operacao_criativo(client, account_id, ad_group_id, creative_path, final_url, image_data)
+            except Exception as ex:
+                resultados[creative_path] = {"resource_name": None, "error": str(ex)}
+                continue
+            operacoes.append((operacao, len(image_data)))
+            caminhos.append(creative_path)
+    
+    if operacoes:
+        print(f"   📤 Enviando {len(operacoes)} criativo(s) para Google Ads (conta {account_id})...")
+        for creative_path, (resource_name, erro) in zip(caminhos, enviar_operacoes(client, account_id, operacoes)):
+            resultados[creative_path] = {"resource_name": resource_name, "error": erro}
+    return resultados
+
+def upload_creatives(client, account_id, ad_group_id, creative_paths, final_url, existentes=None):
     print(f"🚀 Iniciando upload de {len(creative_paths)} criativos...")
     print(f"   Account ID: {account_id}")
     print(f"   Ad Group ID: {ad_group_id}")
     print(f"   Final URL: {final_url}")
     
-    try:
-        ad_group_ad_service = client.get_service("AdGroupAdService")
-        print("✅ Serviço AdGroupAdService obtido")
-    except Exception as e:
-        print(f"❌ Erro ao obter serviço AdGroupAdService: {e}")
-        return
+    resultados = upload_creatives_em_lote(client, account_id, [(ad_group_id, creative_paths, final_url)], existentes)
     
     success_count = 0
     error_count = 0
-    
-    for idx, creative_path in enumerate(creative_paths, 1):
-        try:
-            print(f"\n📤 Enviando criativo {idx}/{len(creative_paths)}: {os.path.basename(creative_path)}")
-            
-            # Verifica se o arquivo existe
-            if not os.path.exists(creative_path):
-                print(f"   ❌ Arquivo não encontrado: {creative_path}")
-                error_count += 1
-                continue
-            
-            # Lê o arquivo
-            with open(creative_path, "rb") as f:
-                image_data = f.read()
-            print(f"   ✅ Arquivo lido: {len(image_data)} bytes")
-            
-            # Cria a operação
-            ad_operation = client.get_type("AdGroupAdOperation")
-            ad = ad_operation.create
-            ad.ad_group = f"customers/{account_id}/adGroups/{ad_group_id}"
-            ad.status = client.enums.AdGroupAdStatusEnum.ENABLED
-            
-            # Configura o anúncio de imagem
-            image_ad = ad.ad.image_ad
-            image_ad.data = image_data
-            
-            # Define o tipo MIME
-            ext = os.path.splitext(creative_path)[1].lower()
-            if ext == ".gif":
-                image_ad.mime_type = client.enums.MimeTypeEnum.IMAGE_GIF
-            else:
-                image_ad.mime_type = client.enums.MimeTypeEnum.IMAGE_PNG
-            
-            # Configura URLs
-            ad.ad.final_urls.append(final_url)
-            ad.ad.display_url = final_url.split("://")[-1]
-            ad.ad.name = os.path.splitext(os.path.basename(creative_path))[0]
-            
-            print(f"   📤 Enviando para Google Ads...")
-            
-            # Faz o upload (sem fazer_requisicao_liberada para evitar problemas)
-            response = ad_group_ad_service.mutate_ad_group_ads(
-                customer_id=account_id,
-                operations=[ad_operation]
-            )
-            
-            if response and response.results:
-                for result in response.results:
-                    print(f"   ✅ Criativo enviado com sucesso: {result.resource_name}")
-                    success_count += 1
-            else:
-                print(f"   ⚠️ Resposta vazia do Google Ads")
-                error_count += 1
-                
-        except Exception as ex:
-            print(f"   ❌ Erro ao enviar o criativo {os.path.basename(creative_path)}: {ex}")
+    duplicate_count = 0
+    for creative_path in creative_paths:
+        resultado = resultados[creative_path]
+        if resultado.get("duplicado"):
+            print(f"   ↩️ Criativo já existe no grupo, não enviado de novo: {os.path.basename(creative_path)} -> {resultado['resource_name']}")
+            duplicate_count += 1
+        elif resultado["resource_name"]:
+            print(f"   ✅ Criativo enviado com sucesso: {os.path.basename(creative_path)} -> {resultado['resource_name']}")
+            success_count += 1
+        else:
+            print(f"   ❌ Erro ao enviar o criativo {os.path.basename(creative_path)}: {resultado['error']}")
             error_count += 1
     
     print(f"\n📊 Resultado do Upload:")
     print(f"   ✅ Sucessos: {success_count}")
     print(f"   ❌ Erros: {error_count}")
+    if duplicate_count:
+        print(f"   ↩️ Já existentes: {duplicate_count}")
     
     if success_count > 0:
         print(f"🎉 {success_count} criativo(s) enviado(s) com sucesso!")
     else:
         print(f"❌ Nenhum criativo foi enviado com sucesso.")
+    return resultados
+
+# ------------------------ PIPELINE DE CAMPANHAS ------------------------
+def jobs_campanhas(df, quantidade, templates_especificos=None, tag=None, perfil_png=None):
+    """Cria um Job por linha da planilha, ignorando (conta, grupo) repetidos."""
+    jobs = []
+    vistos = set()
+    for idx, row in df.iterrows():
+        job = Job(
+            len(jobs), linha=idx, site=row["Site"], pais=row["País"], account_id=None, ad_group_id=None,
+            quantidade=quantidade, templates_especificos=templates_especificos, tag=tag, perfil_png=perfil_png,
+            idioma=None, logo_path=None, criativos=[], final_url=None, uploads={}, pulado=False, _trava=None
+        )
+        try:
+            # Remove hyphens from account ID and convert to string
+            job.account_id = str(int(row["ID da Conta"].replace("-", "")))
+            job.ad_group_id = str(int(row["ID do Grupo de Anúncios"]))
+        except Exception as e:
+            job.etapa = "planilha"
+            job.erro = f"IDs inválidos: {e}"
+        else:
+            if (job.account_id, job.ad_group_id) in vistos:
+                print(f"⚠️ Criativos para a conta {job.account_id}, grupo {job.ad_group_id} já foram processados. Pulando...")
+                continue
+            vistos.add((job.account_id, job.ad_group_id))
+        jobs.append(job)
+    return jobs
+
+def abrir_execucao(jobs, retomar=False):
+    """Abre no diário a execução dos jobs; retorna o id dela, ou None sem diário.
+
+    Com retomar, reabre a última execução da mesma seleção de grupos que
+    não terminou e marca como pulados os jobs cujo grupo já foi concluído
+    nela. Grupos concluídos em outras execuções são processados normalmente.
+    """
+    journal = get_journal()
+    if journal is None:
+        if retomar:
+            print("⚠️ JOURNAL_FILE vazio: não há diário para retomar, processando tudo.")
+        return None
+    pares = [(job.account_id, job.ad_group_id) for job in jobs if job.etapa != "planilha"]
+    execucao, retomada = journal.iniciar_execucao(pares, retomar)
+    if retomar and not retomada:
+        print("⚠️ Nenhuma execução desta seleção ficou por terminar: começando uma nova.")
+    if retomada:
+        print(f"♻️ Retomando a execução {execucao}")
+        for job in jobs:
+            if not job.falhou and not job.pulado and journal.concluido(execucao, job.account_id, job.ad_group_id):
+                job.pulado = True
+                print(f"⏭️ Conta {job.account_id}, grupo {job.ad_group_id} ({job.site}) já concluído. Pulando...")
+    return execucao
+
+def processar_campanhas(client, jobs, urls_finais, urls_manuais=None, ao_concluir=None, execucao=None):
+    """Processa os jobs num pipeline: URL final -> logo -> criativos -> upload.
+
+    Cada etapa tem seus workers (PIPELINE_*_WORKERS) e filas limitadas
+    (PIPELINE_QUEUE_SIZE) entre elas, então o upload de um grupo, a
+    renderização do seguinte e a busca de logo do outro acontecem ao mesmo
+    tempo. urls_finais vem de buscar_urls_finais; urls_manuais (linha -> URL)
+    cobre os grupos sem criativo ativo. Retorna os jobs na ordem original.
+
+    O andamento de cada grupo e criativo vai para o diário (JOURNAL_FILE),
+    na execução aberta por abrir_execucao (ou numa nova, se execucao não
+    vier). Numa execução retomada, criativos renderizados mas não enviados
+    são enviados sem renderizar de novo.
+    """
+    urls_manuais = urls_manuais or {}
+    journal = get_journal()
+    if journal and execucao is None:
+        execucao = abrir_execucao(jobs)
+    # Dois grupos do mesmo site e idioma gravam na mesma pasta com os mesmos nomes:
+    # a pasta fica reservada da renderização até o fim do upload
+    travas = {}
+    travas_lock = threading.Lock()
+
+    def etapa_url(job):
+        job.final_url = urls_finais.get((job.account_id, job.ad_group_id)) or urls_manuais.get(job.linha)
+        if not job.final_url:
+            raise EtapaFalhou(f"URL final não encontrada para {job.site}")
+
+    def etapa_logo(job):
+        job.idioma = buscar_idioma_por_pais(job.pais)
+        if not job.idioma:
+            raise EtapaFalhou(f"Idioma não encontrado para o país {job.pais}")
+        job.logo_path = buscar_logo_por_site(job.site)
+        if not job.logo_path:
+            raise EtapaFalhou(f"Logo não encontrada para o site {job.site}")
+
+    def etapa_render(job):
+        with travas_lock:
+            trava = travas.setdefault((job.idioma, job.site), threading.Lock())
+        trava.acquire()
+        try:
+            pendentes = journal.pendentes(execucao, job.account_id, job.ad_group_id) if journal else None
+            if pendentes:
+                # Retomada: envia o que já foi renderizado (e continua igual no disco)
+                enviados = journal.enviados(execucao, job.account_id, job.ad_group_id)
+                job.uploads = {caminho: {"resource_name": resource_name, "error": None} for caminho, resource_name in enviados.items()}
+                job.criativos = list(dict.fromkeys(list(enviados) + pendentes))
+                job.a_enviar = pendentes
+                print(f"♻️ Retomando {job.site}: {len(pendentes)} criativo(s) renderizado(s) aguardando upload")
+            else:
+                job.criativos = gerar_criativos(
+                    job.site, job.idioma, job.quantidade, job.logo_path,
+                    job.templates_especificos, job.tag, perfil_png=job.perfil_png
+                )
+                job.a_enviar = job.criativos
+                if job.criativos and journal:
+                    journal.registrar_renderizados(execucao, job.account_id, job.ad_group_id, job.site, job.criativos)
+        except Exception:
+            trava.release()
+            raise
+        if not job.criativos:
+            trava.release()
+            raise EtapaFalhou(f"Nenhum criativo gerado para o site {job.site}")
+        job._trava = trava
+
+    def etapa_upload(job):
+        try:
+            resultados = upload_creatives(client, job.account_id, job.ad_group_id, job.a_enviar, job.final_url, existentes)
+        finally:
+            job._trava.release()
+        if journal:
+            journal.registrar_uploads(execucao, job.account_id, job.ad_group_id, resultados)
+        job.uploads.update(resultados)
+        if not any(resultado["resource_name"] for resultado in resultados.values()):
+            erros = [resultado["error"] for resultado in resultados.values() if resultado["error"]]
+            raise EtapaFalhou(f"Nenhum criativo enviado: {erros[0] if erros else 'erro desconhecido'}")
+
+    def concluir(job):
+        # Falhas antes do upload também ficam no diário (o upload registra as suas)
+        if journal and job.falhou and job.etapa in ("url", "logo", "render"):
+            journal.registrar_erro(execucao, job.account_id, job.ad_group_id, job.site, job.erro)
+        if ao_concluir is not None:
+            ao_concluir(job)
+
+    pipeline = Pipeline([
+        Etapa("url", etapa_url),
+        Etapa("logo", etapa_logo, config.PIPELINE_LOGO_WORKERS),
+        Etapa("render", etapa_render, config.PIPELINE_RENDER_WORKERS),
+        Etapa("upload", etapa_upload, config.PIPELINE_UPLOAD_WORKERS),
+    ])
+    pulados = [job for job in jobs if job.pulado]
+    for job in pulados:
+        concluir(job)
+    # Anúncios já presentes nos grupos, buscados de uma vez para evitar uploads duplicados
+    existentes = None
+    if config.UPLOAD_SKIP_DUPLICATES:
+        existentes = buscar_anuncios_existentes(
+            client, [(job.account_id, job.ad_group_id) for job in jobs if not job.falhou and not job.pulado]
+        )
+    executados = pipeline.executar([job for job in jobs if not job.pulado], concluir)
+    if journal:
+        # Com todos os grupos concluídos, a execução não é mais retomada
+        journal.encerrar_execucao(execucao, [(job.account_id, job.ad_group_id) for job in jobs if job.etapa != "planilha"])
+    return sorted(executados + pulados, key=lambda job: job.indice)
+
+def relatorio_campanhas(jobs):
+    """Uma linha (dict) por job com o resultado final, para imprimir ou montar um DataFrame."""
+    relatorio = []
+    for job in jobs:
+        enviados = sum(1 for resultado in job.uploads.values() if resultado["resource_name"])
+        duplicados = sum(1 for resultado in job.uploads.values() if resultado.get("duplicado"))
+        if job.falhou:
+            status = "❌ erro"
+        elif job.pulado:
+            status = "⏭️ já concluído"
+        elif enviados < len(job.criativos):
+            status = "⚠️ parcial"
+        else:
+            status = "✅ ok"
+        relatorio.append({
+            "Linha": job.linha,
+            "Site": job.site,
+            "Conta": job.account_id,
+            "Grupo": job.ad_group_id,
+            "Status": status,
+            "Criativos": len(job.criativos),
+            "Enviados": enviados,
+            "Já existentes": duplicados,
+            "Etapa": job.etapa or "",
+            "Erro": job.erro or "",
+            "Tempo (s)": round(sum(job.tempos.values()), 1),
+        })
+    return relatorio
+
+def imprimir_relatorio(jobs):
+    print("\n📊 Resultado por grupo de anúncios:")
+    for linha in relatorio_campanhas(jobs):
+        detalhe = f" [{linha['Etapa']}] {linha['Erro']}" if linha["Erro"] else ""
+        print(f"   {linha['Status']} {linha['Site']} (conta {linha['Conta']}, grupo {linha['Grupo']}): "
+              f"{linha['Enviados']}/{linha['Criativos']} enviados"
+              + (f" ({linha['Já existentes']} já existiam)" if linha["Já existentes"] else "")
+              + f" em {linha['Tempo (s)']}s{detalhe}")
 
 def show_notification(title, message, duration=15):
     """Cross-platform notification function"""
@@ -617,31 +923,51 @@ def show_notification(title, message, duration=15):
         print(f"📱 {title}: {message}")  # Fallback to console print
 
 # ------------------------ FUNÇÃO INTERATIVA (CASO NÃO SEJAM PASSADOS PARÂMETROS) ------------------------
-def main_interativo():
+def filtrar_paises(df, paises):
+    """Linhas da planilha dos países informados (None = todos)."""
+    if paises is None:
+        return df
+    df_filtrado = pd.DataFrame()
+    for pais in paises:
+        df_pais = df[df["País"].str.contains(pais, case=False, na=False)]
+        if df_pais.empty:
+            print(f"⚠️ Nenhuma campanha encontrada para o país: {pais}")
+        else:
+            df_filtrado = pd.concat([df_filtrado, df_pais])
+    return df_filtrado.drop_duplicates()
+
+def filtrar_campanhas(df, campanhas):
+    """Linhas das campanhas informadas (None = todas); 'all T1' seleciona as campanhas com a tag [ - T1 - ].
+
+    Retorna (df, tag), onde tag é a última tag pedida (usada para escolher a pasta de templates).
+    """
+    if campanhas is None:
+        return df, None
+    df_final = pd.DataFrame()
+    tag = None
+    for item in campanhas:
+        if item.lower().startswith("all "):
+            tag = item[4:].strip().upper()
+            pattern = re.escape(f"[ - {tag} - ]")
+            df_filtered = df[df["Campanha"].str.contains(pattern, case=False, na=False)]
+            df_final = pd.concat([df_final, df_filtered])
+        else:
+            df_filtered = df[df["Campanha"] == item]
+            df_final = pd.concat([df_final, df_filtered])
+    return df_final.drop_duplicates(), tag
+
+def main_interativo(retomar=False):
     df = ler_planilha()
     if df is None or df.empty:
         print("Nenhuma campanha encontrada na planilha.")
         exit(1)
     
     pais_selecionado = input("Digite o(s) país(es) para subir os criativos (separados por vírgula, ou 'all' para todos os países): ").strip()
-    
-    if pais_selecionado.lower() == "all":
-        df_filtrado = df
-    else:
-        paises = [p.strip() for p in pais_selecionado.split(",") if p.strip()]
-        df_filtrado = pd.DataFrame()
-        for pais in paises:
-            df_pais = df[df["País"].str.contains(pais, case=False, na=False)]
-            if df_pais.empty:
-                print(f"⚠️ Nenhuma campanha encontrada para o país: {pais}")
-            else:
-                df_filtrado = pd.concat([df_filtrado, df_pais])
-        
-        if df_filtrado.empty:
-            print("❌ Nenhuma campanha encontrada para os países informados.")
-            exit(1)
-        
-        df_filtrado = df_filtrado.drop_duplicates()
+    paises = None if pais_selecionado.lower() == "all" else [p.strip() for p in pais_selecionado.split(",") if p.strip()]
+    df_filtrado = filtrar_paises(df, paises)
+    if df_filtrado.empty:
+        print("❌ Nenhuma campanha encontrada para os países informados.")
+        exit(1)
     
     print("Campanhas encontradas:")
     campanhas_unicas = df_filtrado["Campanha"].unique()
@@ -649,26 +975,11 @@ def main_interativo():
         print(f" - {campanha}")
     
     campanhas_input = input("Digite as campanhas que deseja processar (separadas por vírgula, 'all' para todas ou 'all T1', 'all T2', etc.): ").strip()
-    if campanhas_input.lower() == "all":
-        df_final = df_filtrado
-        tag = None
-    else:
-        campanhas_escolhidas = [c.strip() for c in campanhas_input.split(",") if c.strip()]
-        df_final = pd.DataFrame()
-        tag = None
-        for item in campanhas_escolhidas:
-            if item.lower().startswith("all "):
-                tag = item[4:].strip().upper()
-                pattern = re.escape(f"[ - {tag} - ]")
-                df_filtered = df_filtrado[df_filtrado["Campanha"].str.contains(pattern, case=False, na=False)]
-                df_final = pd.concat([df_final, df_filtered])
-            else:
-                df_filtered = df_filtrado[df_filtrado["Campanha"] == item]
-                df_final = pd.concat([df_final, df_filtered])
-        df_final = df_final.drop_duplicates()
-        if df_final.empty:
-            print("❌ Nenhuma campanha corresponde à seleção.")
-            exit(1)
+    campanhas = None if campanhas_input.lower() == "all" else [c.strip() for c in campanhas_input.split(",") if c.strip()]
+    df_final, tag = filtrar_campanhas(df_filtrado, campanhas)
+    if df_final.empty:
+        print("❌ Nenhuma campanha corresponde à seleção.")
+        exit(1)
     
     usar_mesmas_config = False
     config_global = {}
@@ -690,68 +1001,130 @@ def main_interativo():
                 "quantidade": quantidade_global
             }
     
-    client = GoogleAdsClient.load_from_storage("google-ads.yaml")
-    processados = set()
-    for idx, row in df_final.iterrows():
-        try:
-            # Remove hyphens from account ID and convert to string
-            account_id = str(int(row["ID da Conta"].replace("-", "")))
-            ad_group_id = str(int(row["ID do Grupo de Anúncios"]))
-        except Exception as e:
-            print(f"Erro ao converter IDs na linha {idx}: {e}")
-            continue
-        
-        site = row["Site"]
-        if (account_id, ad_group_id) in processados:
-            print(f"⚠️ Criativos para a conta {account_id}, grupo {ad_group_id} já foram processados. Pulando...")
-            continue
-        processados.add((account_id, ad_group_id))
-        
-        logo_path = buscar_logo_por_site(site)
-        if not logo_path:
-            print(f"⚠️ Logo não encontrada para o site {site}. Pulando...")
-            continue
-        
-        if not usar_mesmas_config:
-            opcao = input("Deseja gerar criativos aleatórios ou específicos? (A/E): ").strip().lower()
-            templates_especificos = None
+    if usar_mesmas_config:
+        jobs = jobs_campanhas(df_final, config_global["quantidade"], config_global["templates_especificos"], tag)
+    else:
+        jobs = jobs_campanhas(df_final, None, tag=tag)
+    execucao = abrir_execucao(jobs, retomar)
+    if not usar_mesmas_config:
+        # As perguntas vêm antes de o pipeline começar, para não se misturarem à saída das etapas
+        for job in jobs:
+            if job.falhou or job.pulado:
+                continue
+            opcao = input(f"Deseja gerar criativos aleatórios ou específicos para o site {job.site}? (A/E): ").strip().lower()
             if opcao == "e":
                 templates_especificos = input("Digite os nomes dos templates específicos (separados por vírgula): ").strip().split(",")
-                templates_especificos = [t.strip() for t in templates_especificos if t.strip()]
-            qtd_input = input(f"Quantos criativos deseja gerar para o site {site}? (Digite um número ou 'all'): ").strip()
-            quantidade = "all" if qtd_input.lower() == "all" else int(qtd_input)
-        else:
-            opcao = config_global["opcao"]
-            templates_especificos = config_global["templates_especificos"]
-            quantidade = config_global["quantidade"]
-        
-        idioma = buscar_idioma_por_pais(row["País"])
-        if not idioma:
-            print(f"❌ Idioma não encontrado para o país {row['País']}. Pulando {site}.")
-            continue
-        
-        criativos = gerar_criativos(site, idioma, quantidade, logo_path, templates_especificos, tag)
-        if not criativos:
-            print(f"❌ Nenhum criativo gerado para o site {site}.")
+                job.templates_especificos = [t.strip() for t in templates_especificos if t.strip()]
+            qtd_input = input(f"Quantos criativos deseja gerar para o site {job.site}? (Digite um número ou 'all'): ").strip()
+            job.quantidade = "all" if qtd_input.lower() == "all" else int(qtd_input)
+    
+    client = GoogleAdsClient.load_from_storage("google-ads.yaml")
+    
+    # Busca as URLs finais de todos os grupos selecionados de uma vez (uma consulta por conta)
+    urls_finais = buscar_urls_finais(client, [(job.account_id, job.ad_group_id) for job in jobs if not job.falhou and not job.pulado])
+    urls_manuais = {}
+    for job in jobs:
+        if job.falhou or job.pulado:
             continue
-        
-        final_url = get_existing_creatives(client, account_id, ad_group_id)
+        final_url = urls_finais.get((job.account_id, job.ad_group_id))
         if final_url:
-            print(f"✅ URL final encontrada: {final_url}")
+            print(f"✅ URL final encontrada para {job.site}: {final_url}")
         else:
-            print(f"⚠️ Nenhum criativo ativo encontrado para o site {site}.")
-            final_url = input(f"Digite a URL final para o site {site}: ").strip()
-        
-        upload_creatives(client, account_id, ad_group_id, criativos, final_url)
+            print(f"⚠️ Nenhum criativo ativo encontrado para o site {job.site}.")
+            urls_manuais[job.linha] = input(f"Digite a URL final para o site {job.site}: ").strip()
+    
+    jobs = processar_campanhas(client, jobs, urls_finais, urls_manuais, execucao=execucao)
+    imprimir_relatorio(jobs)
+
+def main_batch(spec):
+    """Execução sem perguntas a partir de um JobSpec (subcomando batch); retorna o código de saída.
+
+    Filtra a planilha pelos países e campanhas da spec, aplica quantidade,
+    templates e URLs e processa tudo pelo pipeline. Grupos sem URL final
+    falham na etapa url em vez de esperar uma resposta. O relatório é
+    impresso e, se pedido, gravado em CSV ou JSON.
+    """
+    spec.aplicar_config()
+    df = ler_planilha()
+    if df is None or df.empty:
+        print("❌ Nenhuma campanha encontrada na planilha.")
+        return SAIDA_ERRO_SPEC
+    df_final, tag = filtrar_campanhas(filtrar_paises(df, spec.paises), spec.campanhas)
+    if df_final.empty:
+        print("❌ Nenhuma campanha corresponde aos filtros da spec.")
+        return SAIDA_ERRO_SPEC
+
+    jobs = jobs_campanhas(df_final, spec.quantidade, spec.templates, tag)
+    for job in jobs:
+        spec.ajustar_job(job)
+    execucao = abrir_execucao(jobs, spec.retomar)
+    print(f"📋 {len(jobs)} grupo(s) de anúncios selecionado(s) por {spec.origem}")
+
+    try:
+        client = GoogleAdsClient.load_from_storage("google-ads.yaml")
+    except Exception as e:
+        print(f"❌ Não foi possível carregar google-ads.yaml: {e}")
+        return SAIDA_ERRO_SPEC
+
+    # URLs da spec têm prioridade; as demais vêm dos criativos ativos de cada grupo
+    urls_spec = {(job.account_id, job.ad_group_id): spec.url_final(job) for job in jobs if not job.falhou and not job.pulado}
+    urls_finais = buscar_urls_finais(client, [par for par, url in urls_spec.items() if not url])
+    urls_finais.update({par: url for par, url in urls_spec.items() if url})
+
+    jobs = processar_campanhas(client, jobs, urls_finais, execucao=execucao)
+    imprimir_relatorio(jobs)
+    relatorio = relatorio_campanhas(jobs)
+    if spec.relatorio:
+        if os.path.dirname(spec.relatorio):
+            os.makedirs(os.path.dirname(spec.relatorio), exist_ok=True)
+        if spec.relatorio.lower().endswith(".json"):
+            pd.DataFrame(relatorio).to_json(spec.relatorio, orient="records", force_ascii=False, indent=2)
+        else:
+            pd.DataFrame(relatorio).to_csv(spec.relatorio, index=False)
+        print(f"📝 Relatório gravado em {spec.relatorio}")
+
+    if any(job.falhou or linha["Status"] == "⚠️ parcial" for job, linha in zip(jobs, relatorio)):
+        return SAIDA_FALHAS
+    return SAIDA_OK
 
 # ------------------------ EXECUÇÃO PRINCIPAL ------------------------
 if __name__ == "__main__":
+    # Create credential files if environment variables are available. Only here: the
+    # render pool uses "spawn", and its workers import this module as __mp_main__
+    create_credentials_files()
+
     parser = argparse.ArgumentParser(description="Gerar criativos automaticamente para campanha com menos de 8 criativos.")
     parser.add_argument("--account_id", type=str, help="ID da Conta do Google Ads")
     parser.add_argument("--ad_group_id", type=str, help="ID do Grupo de Anúncios")
     parser.add_argument("--site", type=str, help="Nome do Site ou Campanha")
     parser.add_argument("--quantity", type=str, help="Quantidade de criativos a serem gerados (número ou 'all')")
+    parser.add_argument("--encoder_profile", type=str, choices=sorted(PERFIS_PNG), help="Perfil do encoder PNG (padrão: PNG_ENCODER_PROFILE)")
+    parser.add_argument("--resume", action="store_true", help="Retoma pelo diário a última execução da mesma seleção que não terminou (pula os grupos concluídos nela e reaproveita seus criativos já renderizados)")
+    subparsers = parser.add_subparsers(dest="comando")
+    parser_batch = subparsers.add_parser(
+        "batch",
+        help="Executa sem perguntas a partir de um job spec YAML/JSON (para cron)",
+        description="Executa sem perguntas a partir de um job spec YAML/JSON. Saída 0: tudo enviado; "
+                    "1: algum grupo falhou ou ficou parcial; 2: spec inválida ou nada a processar."
+    )
+    parser_batch.add_argument("spec", help="Arquivo do job spec (.yaml, .yml ou .json)")
+    parser_batch.add_argument("--resume", dest="batch_resume", action="store_true", help="Retoma pelo diário a última execução desta seleção que não terminou (equivale a retomar: true na spec)")
     args = parser.parse_args()
+    
+    if args.encoder_profile:
+        config.PNG_ENCODER_PROFILE = args.encoder_profile
+
+    if args.comando == "batch":
+        try:
+            spec = carregar_spec(args.spec)
+        except SpecInvalida as e:
+            print(f"❌ Job spec inválido: {e}")
+            exit(SAIDA_ERRO_SPEC)
+        spec.retomar = spec.retomar or args.resume or args.batch_resume
+        codigo = main_batch(spec)
+        for linha in get_render_engine().stats.resumo() + get_render_cache().resumo() + get_prepared_templates().cache.resumo():
+            print(linha)
+        exit(codigo)
 
     if args.account_id and args.ad_group_id and args.site and args.quantity:
         # Remove hyphens from account ID
@@ -787,7 +1160,10 @@ if __name__ == "__main__":
         upload_creatives(client, account_id, ad_group_id, criativos, final_url)
         
     else:
-        main_interativo()
+        main_interativo(retomar=args.resume)
+    
+    for linha in get_render_engine().stats.resumo() + get_render_cache().resumo() + get_prepared_templates().cache.resumo():
+        print(linha)
 
     if NOTIFICATION_AVAILABLE:
         show_notification(
@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+
+from config import config
+
+# Marca de fim de fila entre as etapas
+_FIM = object()
+
+
+class EtapaFalhou(Exception):
+    """Falha esperada de uma etapa (ex.: logo não encontrada); o job sai do pipeline com essa mensagem."""
+
+
+class Etapa:
+    """Uma etapa do pipeline: nome, função aplicada a cada job e número de workers."""
+
+    def __init__(self, nome, funcao, workers=1):
+        self.nome = nome
+        self.funcao = funcao
+        self.workers = max(1, workers)
+
+
+class Job:
+    """Item que atravessa o pipeline.
+
+    As etapas leem e preenchem os atributos livremente; o pipeline registra o
+    tempo gasto em cada etapa e, em caso de falha, a etapa e o erro. Um job com
+    erro pula as etapas seguintes e vai direto para o resultado.
+    """
+
+    def __init__(self, indice, **dados):
+        self.indice = indice
+        self.etapa = None
+        self.erro = None
+        self.tempos = {}
+        self.__dict__.update(dados)
+
+    @property
+    def falhou(self):
+        return self.erro is not None
+
+
+class Pipeline:
+    """Executa jobs por uma sequência de etapas, com filas limitadas entre elas.
+
+    Cada etapa tem seus próprios workers (threads), então enquanto o job N está
+    na última etapa, o N+1 está na anterior e assim por diante. As filas têm
+    capacidade limitada: quando uma etapa lenta acumula trabalho, as anteriores
+    bloqueiam (backpressure) em vez de encher memória e disco. ao_concluir(job)
+    é chamado na thread de quem chamou executar, na ordem em que os jobs
+    terminam (útil para barras de progresso).
+    """
+
+    def __init__(self, etapas, capacidade=None):
+        self.etapas = etapas
+        self.capacidade = capacidade or config.PIPELINE_QUEUE_SIZE
+
+    def _worker(self, etapa, entrada, saida, concluidos, restantes, lock):
+        while True:
+            job = entrada.get()
+            if job is _FIM:
+                break
+            if job.falhou:
+                concluidos.put(job)
+                continue
+            inicio = time.perf_counter()
+            try:
+                etapa.funcao(job)
+            except Exception as e:
+                job.etapa = etapa.nome
+                job.erro = str(e) if isinstance(e, EtapaFalhou) else f"{e.__class__.__name__}: {e}"
+            job.tempos[etapa.nome] = time.perf_counter() - inicio
+            if job.falhou or saida is None:
+                concluidos.put(job)
+            else:
+                saida.put(job)
+        # O último worker da etapa avisa a próxima que não vem mais nada
+        with lock:
+            restantes[etapa.nome] -= 1
+            ultimo = restantes[etapa.nome] == 0
+        if ultimo:
+            if saida is None:
+                concluidos.put(_FIM)
+            else:
+                for _ in range(self._proxima(etapa).workers):
+                    saida.put(_FIM)
+
+    def _proxima(self, etapa):
+        return self.etapas[self.etapas.index(etapa) + 1]
+
+    def executar(self, jobs, ao_concluir=None):
+        """Processa os jobs e os retorna na ordem original."""
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        filas = [queue.Queue(maxsize=self.capacidade) for _ in self.etapas]
+        concluidos = queue.Queue()
+        restantes = {etapa.nome: etapa.workers for etapa in self.etapas}
+        lock = threading.Lock()
+
+        threads = []
+        for posicao, etapa in enumerate(self.etapas):
+            saida = filas[posicao + 1] if posicao + 1 < len(filas) else None
+            for numero in range(etapa.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(etapa, filas[posicao], saida, concluidos, restantes, lock),
+                    name=f"pipeline-{etapa.nome}-{numero}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        def alimentar():
+            for job in jobs:
+                filas[0].put(job)  # bloqueia quando a primeira etapa está cheia
+            for _ in range(self.etapas[0].workers):
+                filas[0].put(_FIM)
+
+        threading.Thread(target=alimentar, name="pipeline-entrada", daemon=True).start()
+
+        while True:
+            job = concluidos.get()
+            if job is _FIM:
+                break
+            if ao_concluir is not None:
+                ao_concluir(job)
+        for thread in threads:
+            thread.join()
+        return sorted(jobs, key=lambda job: job.indice)
@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import random
+import socket
+import threading
+import time
+
+from config import config
+
+try:
+    from googleapiclient.errors import HttpError
+except ImportError:
+    HttpError = None
+
+try:
+    from google.ads.googleads.errors import GoogleAdsException
+except ImportError:
+    GoogleAdsException = None
+
+# Códigos gRPC transitórios do Google Ads
+ADS_RETRYABLE_STATUS = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "ABORTED"}
+# Códigos HTTP transitórios (Drive e Sheets)
+HTTP_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+HTTP_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "RATE_LIMIT_EXCEEDED"}
+# Erros que garantem que a requisição foi recusada antes de ser aplicada: os únicos
+# repetidos em chamadas não idempotentes (ex.: mutate de criação), já que um timeout
+# ou erro interno pode chegar depois de o servidor ter criado os recursos
+ADS_NAO_APLICADO_STATUS = {"RESOURCE_EXHAUSTED"}
+HTTP_NAO_APLICADO_STATUS = {429}
+
+
+class TokenBucket:
+    """Token bucket thread-safe: até capacity requisições em rajada, repostas a rate por segundo."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _try_acquire(self, tokens):
+        """Consome os tokens e retorna 0, ou retorna quantos segundos faltam para haver tokens."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Bloqueia até haver tokens disponíveis e os consome."""
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """Como acquire, mas espera com asyncio.sleep, sem ocupar uma thread."""
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def drain(self, seconds):
+        """Esvazia o bucket para que todos os workers respeitem um retry-after do servidor."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class RetryableError(Exception):
+    """Erro transitório que esgotou as tentativas de retry."""
+
+
+def _retry_after_http(error):
+    value = error.resp.get("retry-after") if getattr(error, "resp", None) is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _retry_after_ads(exception):
+    for ads_error in exception.failure.errors:
+        retry_delay = getattr(getattr(ads_error.details, "quota_error_details", None), "retry_delay", None)
+        if retry_delay:
+            seconds = retry_delay.total_seconds() if hasattr(retry_delay, "total_seconds") else retry_delay.seconds
+            if seconds:
+                return float(seconds)
+    return None
+
+
+def classificar_erro(error, idempotente=True):
+    """Retorna (transitório?, retry_after em segundos ou None) para uma exceção de API.
+
+    Com idempotente=False, só conta como transitório o erro que garante que
+    nada foi aplicado (limite de requisições).
+    """
+    if HttpError is not None and isinstance(error, HttpError):
+        status = error.resp.status
+        if not idempotente:
+            return status in HTTP_NAO_APLICADO_STATUS, _retry_after_http(error)
+        if status in HTTP_RETRYABLE_STATUS:
+            return True, _retry_after_http(error)
+        if status == 403 and any(reason in str(error) for reason in HTTP_RATE_LIMIT_REASONS):
+            return True, _retry_after_http(error)
+        return False, None
+    if GoogleAdsException is not None and isinstance(error, GoogleAdsException):
+        if error.error.code().name in (ADS_RETRYABLE_STATUS if idempotente else ADS_NAO_APLICADO_STATUS):
+            return True, _retry_after_ads(error)
+        return False, None
+    if isinstance(error, (socket.timeout, ConnectionError, TimeoutError)):
+        return idempotente, None
+    return False, None
+
+
+class RateLimiter:
+    """Limites de requisição por API (ads, drive, sheets) com retry e backoff exponencial.
+
+    Cada API tem um token bucket compartilhado por todas as threads do processo.
+    Erros transitórios (429, RESOURCE_EXHAUSTED, 5xx) são repetidos com backoff
+    exponencial com jitter, respeitando o retry-after informado pelo servidor.
+    Chamadas com idempotente=False só são repetidas após 429/RESOURCE_EXHAUSTED.
+    """
+
+    def __init__(self, limits=None):
+        limits = limits or {
+            # (requisições por segundo, rajada máxima)
+            "ads": (config.MAX_REQUESTS / 3600.0, config.MAX_REQUESTS),
+            "drive": (config.DRIVE_REQUESTS_PER_SECOND, config.DRIVE_REQUESTS_PER_SECOND * 2),
+            "sheets": (config.SHEETS_REQUESTS_PER_SECOND, max(1, config.SHEETS_REQUESTS_PER_SECOND * 2)),
+        }
+        self.buckets = {api: TokenBucket(rate, capacity) for api, (rate, capacity) in limits.items()}
+        self.max_attempts = config.RETRY_MAX_ATTEMPTS
+        self.base_delay = config.RETRY_BASE_DELAY
+        self.max_delay = config.RETRY_MAX_DELAY
+
+    def _espera_retry(self, api, attempt, error, idempotente=True):
+        """Segundos até a próxima tentativa; relança o erro se não for transitório ou se as tentativas acabaram."""
+        retryable, retry_after = classificar_erro(error, idempotente)
+        if not retryable:
+            raise error
+        if attempt == self.max_attempts:
+            raise RetryableError(f"{api}: {self.max_attempts} tentativas esgotadas: {error}") from error
+        # Full jitter: espera aleatória até o teto exponencial
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after:
+            delay = max(delay, retry_after)
+            self.buckets[api].drain(retry_after)
+        print(f"⏳ {api}: erro transitório ({error.__class__.__name__}), nova tentativa {attempt + 1}/{self.max_attempts} em {delay:.1f}s")
+        return delay
+
+    def executar(self, api, func, *args, tokens=1, idempotente=True, **kwargs):
+        """Executa func respeitando o limite da API e repetindo erros transitórios.
+
+        Passe idempotente=False para chamadas que criam recursos, para não
+        repetir uma requisição que o servidor pode já ter aplicado.
+        """
+        bucket = self.buckets[api]
+        for attempt in range(1, self.max_attempts + 1):
+            bucket.acquire(tokens)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self._espera_retry(api, attempt, e, idempotente)
+            time.sleep(delay)
+
+    async def executar_async(self, api, executor, func, *args, tokens=1, idempotente=True, **kwargs):
+        """Versão asyncio de executar: func (síncrona) roda no executor.
+
+        A espera por tokens e o backoff entre tentativas acontecem no event
+        loop, então só a chamada em si ocupa uma thread do executor. Os
+        buckets são os mesmos das chamadas síncronas.
+        """
+        loop = asyncio.get_running_loop()
+        bucket = self.buckets[api]
+        call = functools.partial(func, *args, **kwargs)
+        for attempt in range(1, self.max_attempts + 1):
+            await bucket.acquire_async(tokens)
+            try:
+                return await loop.run_in_executor(executor, call)
+            except Exception as e:
+                delay = self._espera_retry(api, attempt, e, idempotente)
+            await asyncio.sleep(delay)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Retorna o RateLimiter único do processo."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def executar_com_limite(api, func, *args, **kwargs):
+    """Atalho para get_rate_limiter().executar(...)."""
+    return get_rate_limiter().executar(api, func, *args, **kwargs)
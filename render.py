@@ -0,0 +1,697 @@
+import atexit
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from PIL import GifImagePlugin, Image, ImageSequence, PngImagePlugin
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from config import config
+
+# ------------------------ LOGOS PREPARADAS ------------------------
+# Logo já decodificada, convertida para RGBA e redimensionada, com a máscara alfa e a posição de colagem
+LogoPreparada = namedtuple("LogoPreparada", ["image", "mask", "posicao"])
+
+
+def posicao_logo(dimensoes, logo_size, margem=10):
+    """Posição da logo no canto inferior direito do criativo."""
+    return (dimensoes[0] - logo_size[0] - margem, dimensoes[1] - logo_size[1] - margem)
+
+
+class PreparedLogoCache:
+    """Cache LRU, limitado em bytes, de logos prontas para colar.
+
+    A chave é (caminho, mtime, tamanho do arquivo, LOGO_SIZE, DIMENSOES), então
+    uma logo atualizada no disco gera uma entrada nova. Assim a mesma logo é
+    decodificada e redimensionada uma única vez para todos os templates e
+    grupos de anúncios do site.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = config.PREPARED_LOGO_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def _tamanho(logo):
+        # RGBA (4 bytes/pixel) + máscara L (1 byte/pixel)
+        return logo.image.width * logo.image.height * 5
+
+    def get(self, logo_path, logo_size, dimensoes):
+        """Retorna a LogoPreparada do arquivo, preparando-a na primeira vez."""
+        stat = os.stat(logo_path)
+        key = (os.path.abspath(logo_path), stat.st_mtime_ns, stat.st_size, tuple(logo_size), tuple(dimensoes))
+        with self._lock:
+            logo = self._entries.get(key)
+            if logo is not None:
+                self._entries.move_to_end(key)
+                return logo
+
+        with Image.open(logo_path) as imagem:
+            image = imagem.convert("RGBA").resize(logo_size)
+        logo = LogoPreparada(image, image.getchannel("A"), posicao_logo(dimensoes, logo_size))
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = logo
+                self._bytes += self._tamanho(logo)
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    _, removida = self._entries.popitem(last=False)
+                    self._bytes -= self._tamanho(removida)
+        return logo
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_prepared_logos = PreparedLogoCache()
+
+
+def preparar_logo(logo_path, logo_size=None, dimensoes=None):
+    """Retorna a logo pronta para colar (cacheada por arquivo, LOGO_SIZE e DIMENSOES)."""
+    return _prepared_logos.get(logo_path, logo_size or config.LOGO_SIZE, dimensoes or config.DIMENSOES)
+
+
+# ------------------------ COMPOSIÇÃO DOS CRIATIVOS ------------------------
+# Perfis do encoder PNG: "fast" prioriza tempo de renderização, "smallest" o tamanho do upload
+PERFIS_PNG = {
+    "fast": {"optimize": False, "compress_level": 1},
+    "balanced": {"optimize": False, "compress_level": 6},
+    "smallest": {"optimize": True, "compress_level": 9, "reduzir_paleta": True},
+}
+
+
+def _reduzir_paleta_sem_perda(image):
+    """Converte a imagem RGB para modo P quando tem até 256 cores (sem perda); senão retorna a própria imagem.
+
+    Cada pixel recebe o índice exato da sua cor na tabela. quantize() não
+    serve aqui: a busca aproximada do Pillow troca cores muito próximas.
+    """
+    cores = image.getcolors(256)
+    if cores is None:
+        return image
+    paleta = [cor for _, cor in cores]
+    if NUMPY_AVAILABLE:
+        rgb = np.asarray(image, dtype=np.uint32)
+        chaves = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+        tabela = np.array([(r << 16) | (g << 8) | b for r, g, b in paleta], dtype=np.uint32)
+        ordem = np.argsort(tabela)
+        indices = ordem[np.searchsorted(tabela[ordem], chaves)].astype(np.uint8).tobytes()
+    else:
+        posicao = {cor: indice for indice, cor in enumerate(paleta)}
+        indices = bytes(posicao[cor] for cor in image.getdata())
+    imagem_p = Image.frombytes("P", image.size, indices)
+    imagem_p.putpalette([canal for cor in paleta for canal in cor])
+    return imagem_p
+
+
+def salvar_sem_metadados(image, output_path, file_format="PNG", perfil=None):
+    """Salva a imagem (já nas dimensões finais) sem metadados, usando o perfil de encoder PNG."""
+    if file_format.upper() == "GIF":
+        image.save(output_path, format="GIF", optimize=True)
+    else:
+        params = PERFIS_PNG[perfil or config.PNG_ENCODER_PROFILE]
+        image = image.convert("RGB")
+        if params.get("reduzir_paleta"):
+            image = _reduzir_paleta_sem_perda(image)
+        image.save(output_path, format="PNG", optimize=params["optimize"], compress_level=params["compress_level"])
+
+
+class EstatisticasEncoder:
+    """Acumula, por perfil, quantas imagens foram codificadas, o tempo gasto e os bytes gerados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}
+
+    def registrar(self, perfil, segundos, tamanho):
+        with self._lock:
+            dados = self._dados.setdefault(perfil, [0, 0.0, 0])
+            dados[0] += 1
+            dados[1] += segundos
+            dados[2] += tamanho
+
+    def resumo(self):
+        """Retorna uma linha por perfil com média de tempo de encode e de tamanho."""
+        with self._lock:
+            return [
+                f"🗜️ Encoder {perfil}: {total} imagem(ns), {segundos / total * 1000:.1f} ms e {tamanho / total / 1024:.1f} KB em média"
+                for perfil, (total, segundos, tamanho) in sorted(self._dados.items())
+            ]
+
+
+def _frame_rgba(frame, dimensoes, logo):
+    """Converte um frame para RGBA nas dimensões finais (sem reamostrar se já estiver) e cola a logo, se houver."""
+    frame_rgba = frame.convert("RGBA")
+    if frame_rgba.size != tuple(dimensoes):
+        frame_rgba = frame_rgba.resize(dimensoes, Image.Resampling.LANCZOS)
+    if logo is not None:
+        frame_rgba.paste(logo.image, logo.posicao, logo.mask)
+    return frame_rgba
+
+
+def paleta_global_gif(template, dimensoes, logo, amostras=None, cores=255):
+    """Calcula uma única paleta (até `cores` cores) para todos os frames do GIF.
+
+    Alguns frames distribuídos ao longo da animação, já com a logo, são
+    montados numa imagem só e quantizados uma vez (median cut). Como são no
+    máximo 255 cores, sempre sobra um índice para a transparência.
+    """
+    amostras = amostras or config.GIF_PALETTE_SAMPLES
+    total = getattr(template, "n_frames", 1)
+    indices = sorted({round(k * (total - 1) / max(1, amostras - 1)) for k in range(amostras)})
+    largura, altura = dimensoes
+    montagem = Image.new("RGB", (largura, altura * len(indices)))
+    for posicao, indice in enumerate(indices):
+        template.seek(indice)
+        montagem.paste(_frame_rgba(template, dimensoes, logo).convert("RGB"), (0, altura * posicao))
+    template.seek(0)
+    return montagem.quantize(colors=min(cores, 255), method=Image.Quantize.MEDIANCUT)
+
+
+def indice_transparente(paleta):
+    """Primeiro índice livre após as cores da paleta, usado para os pixels transparentes."""
+    return len(paleta.getpalette()) // 3
+
+
+def frames_gif(template, dimensoes, logo, paleta, transparente, passo=1):
+    """Gera os frames do GIF, um por vez, já com a logo e mapeados para a paleta global.
+
+    Com passo > 1, mantém um a cada `passo` frames e soma as durações dos
+    descartados ao frame mantido, preservando o tempo total da animação.
+    """
+    indice = indice_transparente(paleta)
+    # A cor extra só entra na tabela depois do mapeamento, para nenhum pixel opaco cair nela
+    paleta_com_transparente = paleta.getpalette() + [0, 0, 0]
+    pendente = None
+    for numero, frame in enumerate(ImageSequence.Iterator(template)):
+        duration = frame.info.get("duration", 100)
+        if numero % passo:
+            if pendente is not None:
+                pendente.info["duration"] += duration
+            continue
+        if pendente is not None:
+            yield pendente
+        frame_rgba = _frame_rgba(frame, dimensoes, logo)
+        frame_p = frame_rgba.convert("RGB").quantize(palette=paleta, dither=Image.Dither.NONE)
+        if transparente:
+            # Pixels transparentes vão para o índice reservado
+            frame_p.putpalette(paleta_com_transparente)
+            frame_p.paste(indice, mask=frame_rgba.getchannel("A").point(lambda a: 255 if a < 128 else 0))
+        frame_p.info["duration"] = duration
+        pendente = frame_p
+    if pendente is not None:
+        yield pendente
+
+
+class EscritorGifStreaming:
+    """Escreve um GIF animado frame a frame, sem manter os frames em memória.
+
+    O cabeçalho (paleta global, loop) é escrito no primeiro frame; cada frame
+    seguinte é codificado e gravado assim que chega, com a própria duração,
+    disposal e índice de transparência. Frames cuja paleta difere da global
+    levam uma tabela de cores local. close() grava o terminador do arquivo.
+    """
+
+    def __init__(self, fp, loop=0, disposal=2, transparency=None):
+        self.fp = fp
+        self.loop = loop
+        self.disposal = disposal
+        self.transparency = transparency
+        self._paleta_global = None
+        self.frames = 0
+
+    def _params(self, frame):
+        params = {"duration": frame.info.get("duration", 100), "disposal": self.disposal}
+        if self.transparency is not None:
+            params["transparency"] = self.transparency
+        return params
+
+    def write(self, frame):
+        """Codifica e grava um frame em modo P."""
+        if self._paleta_global is None:
+            info = {"loop": self.loop, "duration": frame.info.get("duration", 100)}
+            if self.transparency is not None:
+                info["transparency"] = self.transparency
+            header, _ = GifImagePlugin.getheader(frame, None, info)
+            for bloco in header:
+                self.fp.write(bloco)
+            self._paleta_global = frame.palette.tobytes()
+        params = self._params(frame)
+        if frame.palette.tobytes() != self._paleta_global:
+            params["include_color_table"] = True
+        for bloco in GifImagePlugin.getdata(frame, (0, 0), **params):
+            self.fp.write(bloco)
+        self.frames += 1
+
+    def close(self):
+        self.fp.write(b";")
+
+
+class EscritorApngStreaming:
+    """Escreve um PNG animado (APNG) RGBA frame a frame, sem manter os frames em memória.
+
+    O número de frames vai no cabeçalho (acTL), então precisa ser conhecido
+    antes. Cada frame ocupa a imagem inteira (dispose 0, blend 0) e é
+    comprimido e gravado assim que chega. close() grava o IEND.
+    """
+
+    def __init__(self, fp, size, total_frames, loop=0, textos=None, compress_level=1):
+        self.fp = fp
+        self.size = tuple(size)
+        self.compress_level = compress_level
+        self._sequencia = 0
+        self.frames = 0
+        largura, altura = self.size
+        fp.write(PngImagePlugin._MAGIC)
+        # 8 bits por canal, RGBA, sem entrelaçamento
+        PngImagePlugin.putchunk(fp, b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, 6, 0, 0, 0))
+        for chave, valor in (textos or {}).items():
+            PngImagePlugin.putchunk(fp, b"tEXt", chave.encode("latin-1") + b"\0" + valor.encode("latin-1"))
+        PngImagePlugin.putchunk(fp, b"acTL", struct.pack(">II", total_frames, loop))
+
+    def _proxima_sequencia(self):
+        sequencia = self._sequencia
+        self._sequencia += 1
+        return sequencia
+
+    def write(self, frame, duration):
+        """Comprime e grava um frame RGBA do tamanho da imagem, com a duração em ms."""
+        largura, altura = self.size
+        PngImagePlugin.putchunk(self.fp, b"fcTL", struct.pack(
+            ">IIIIIHHBB", self._proxima_sequencia(), largura, altura, 0, 0, int(round(duration)), 1000, 0, 0
+        ))
+        raw = frame.tobytes()
+        stride = largura * 4
+        # Filtro 0 (nenhum) em cada linha
+        data = zlib.compress(b"".join(b"\0" + raw[i:i + stride] for i in range(0, len(raw), stride)), self.compress_level)
+        if self.frames == 0:
+            PngImagePlugin.putchunk(self.fp, b"IDAT", data)
+        else:
+            PngImagePlugin.putchunk(self.fp, b"fdAT", struct.pack(">I", self._proxima_sequencia()), data)
+        self.frames += 1
+
+    def close(self):
+        PngImagePlugin.putchunk(self.fp, b"IEND", b"")
+
+
+# ------------------------ TEMPLATES PRÉ-REDIMENSIONADOS ------------------------
+# Marca (chunk de texto do PNG) de que o GIF original tinha transparência
+CHAVE_TRANSPARENCIA = "gif-transparency"
+
+
+def preparar_template(template_data, ext, dimensoes):
+    """Redimensiona o template para as dimensões finais, sem perdas, e retorna os bytes.
+
+    PNG: a imagem redimensionada é regravada como PNG, no modo original.
+    GIF: os frames já decodificados e redimensionados (RGBA) vão num PNG
+    animado, com as durações e o loop, gravados um por vez; a transparência
+    do original fica num chunk de texto. renderizar_criativo aceita os dois
+    como template e gera os mesmos bytes, só pulando o redimensionamento.
+    """
+    template = Image.open(io.BytesIO(template_data))
+    output = io.BytesIO()
+    if ext == ".gif":
+        escritor = EscritorApngStreaming(
+            output, dimensoes, getattr(template, "n_frames", 1), loop=template.info.get('loop', 0),
+            textos={CHAVE_TRANSPARENCIA: "1" if "transparency" in template.info else "0"}
+        )
+        for frame in ImageSequence.Iterator(template):
+            escritor.write(_frame_rgba(frame, dimensoes, None), frame.info.get("duration", 100))
+        escritor.close()
+    else:
+        template.resize(dimensoes).save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+def renderizar_criativo(template_data, logo, dimensoes, ext, perfil=None, metricas=None):
+    """Aplica a LogoPreparada sobre o template (bytes) e retorna o criativo codificado (bytes).
+
+    Se metricas for um dict, recebe o perfil usado e o tempo de encode ("perfil", "encode_s").
+    """
+    output = io.BytesIO()
+    perfil = "gif" if ext == ".gif" else (perfil or config.PNG_ENCODER_PROFILE)
+    inicio = time.perf_counter()
+    if ext == ".gif":
+        template = Image.open(io.BytesIO(template_data))
+        if CHAVE_TRANSPARENCIA in template.info:
+            # Template já preparado por preparar_template
+            transparente = template.info[CHAVE_TRANSPARENCIA] == "1"
+        else:
+            transparente = "transparency" in template.info
+        loop = template.info.get('loop', 0)
+
+        paleta = paleta_global_gif(template, dimensoes, logo)
+        escritor = EscritorGifStreaming(
+            output,
+            loop=loop,
+            disposal=2,  # ESSENCIAL para não empilhar a logo!
+            transparency=indice_transparente(paleta) if transparente else None
+        )
+        # Cada frame é gravado assim que fica pronto: pico de memória de um frame
+        for frame_p in frames_gif(template, dimensoes, logo, paleta, transparente):
+            escritor.write(frame_p)
+        escritor.close()
+    else:
+        template = Image.open(io.BytesIO(template_data)).resize(dimensoes)
+        template.paste(logo.image, logo.posicao, logo.mask)
+        inicio = time.perf_counter()
+        salvar_sem_metadados(template, output, "PNG", perfil)
+    if metricas is not None:
+        metricas["perfil"] = perfil
+        metricas["encode_s"] = time.perf_counter() - inicio
+    return output.getvalue()
+
+
+# ------------------------ ORÇAMENTO DE TAMANHO ------------------------
+class CriativoAcimaDoLimite(Exception):
+    """O criativo não coube no limite de bytes nem com as codificações mais baratas."""
+
+
+def _reencodar_png(data, cores=None):
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    if cores:
+        image = image.quantize(colors=cores, method=Image.Quantize.MEDIANCUT)
+    output = io.BytesIO()
+    salvar_sem_metadados(image, output, "PNG", "smallest")
+    return output.getvalue()
+
+
+def _reencodar_gif(data, cores, passo=1):
+    template = Image.open(io.BytesIO(data))
+    transparente = "transparency" in template.info
+    paleta = paleta_global_gif(template, template.size, None, cores=cores)
+    output = io.BytesIO()
+    escritor = EscritorGifStreaming(
+        output,
+        loop=template.info.get('loop', 0),
+        disposal=2,
+        transparency=indice_transparente(paleta) if transparente else None
+    )
+    for frame_p in frames_gif(template, template.size, None, paleta, transparente, passo):
+        escritor.write(frame_p)
+    escritor.close()
+    return output.getvalue()
+
+
+def tentativas_orcamento(ext):
+    """Codificações alternativas, da mais fiel à mais barata, como (descrição, função bytes -> bytes)."""
+    if ext == ".gif":
+        return [
+            ("GIF 128 cores", lambda data: _reencodar_gif(data, 128)),
+            ("GIF 64 cores", lambda data: _reencodar_gif(data, 64)),
+            ("GIF 32 cores", lambda data: _reencodar_gif(data, 32)),
+            ("GIF 64 cores, metade dos frames", lambda data: _reencodar_gif(data, 64, 2)),
+            ("GIF 32 cores, metade dos frames", lambda data: _reencodar_gif(data, 32, 2)),
+            ("GIF 32 cores, um terço dos frames", lambda data: _reencodar_gif(data, 32, 3)),
+        ]
+    return [
+        ("PNG sem perdas, compressão máxima", lambda data: _reencodar_png(data)),
+        ("PNG 256 cores", lambda data: _reencodar_png(data, 256)),
+        ("PNG 128 cores", lambda data: _reencodar_png(data, 128)),
+        ("PNG 64 cores", lambda data: _reencodar_png(data, 64)),
+    ]
+
+
+def ajustar_ao_limite(data, ext, limite=None):
+    """Garante que o criativo caiba em `limite` bytes, tentando codificações mais baratas.
+
+    Cada tentativa parte do criativo original. Retorna (bytes, descrição da
+    codificação usada ou None se não precisou mudar). Levanta
+    CriativoAcimaDoLimite se nenhuma tentativa couber.
+    """
+    limite = limite or config.MAX_CREATIVE_BYTES
+    if len(data) <= limite:
+        return data, None
+    menor = len(data)
+    for descricao, reencodar in tentativas_orcamento(ext):
+        candidato = reencodar(data)
+        if len(candidato) <= limite:
+            return candidato, descricao
+        menor = min(menor, len(candidato))
+    raise CriativoAcimaDoLimite(f"{len(data)} bytes (menor tentativa: {menor}) para limite de {limite} bytes")
+
+
+def _renderizar_job(template_data, logo, dimensoes, ext, perfil):
+    """Job do pool: renderiza, ajusta ao limite de bytes e retorna o criativo e as métricas de encode."""
+    metricas = {}
+    data = renderizar_criativo(template_data, logo, dimensoes, ext, perfil, metricas)
+    data, metricas["orcamento"] = ajustar_ao_limite(data, ext)
+    return data, metricas
+
+
+# ------------------------ COMPOSIÇÃO EM LOTE (NUMPY) ------------------------
+class CompositorLotePNG:
+    """Aplica as logos de vários sites sobre o mesmo template PNG estático.
+
+    O template é decodificado e redimensionado uma única vez. Com NumPy, e
+    com todas as logos do mesmo tamanho e na mesma posição, a região do canto
+    é misturada com todas as logos de uma vez, com a mesma aritmética inteira
+    do paste do PIL (bytes idênticos ao caminho unitário); para cada site só
+    essa região do buffer de trabalho é reescrita antes do encode. Nos outros
+    casos (sem NumPy, template em modo P/L, logos diferentes) cai no paste do
+    PIL, site a site.
+    """
+
+    def __init__(self, template_data, dimensoes):
+        self.base = Image.open(io.BytesIO(template_data)).resize(dimensoes)
+
+    def _regioes(self, logos):
+        """Região do canto já misturada com cada logo: array (N, h, w, canais) uint8."""
+        largura, altura = logos[0].image.size
+        x, y = logos[0].posicao
+        canais = len(self.base.getbands())
+        fundo = np.asarray(self.base, dtype=np.uint32)[y:y + altura, x:x + largura]
+        cores = np.stack([np.asarray(logo.image, dtype=np.uint32)[..., :canais] for logo in logos])
+        alfa = np.stack([np.asarray(logo.mask, dtype=np.uint32) for logo in logos])[..., np.newaxis]
+        # DIV255 do paste do PIL: (fundo * (255 - alfa) + cor * alfa) / 255, arredondado
+        soma = fundo[np.newaxis] * (255 - alfa) + cores * alfa + 128
+        return (((soma >> 8) + soma) >> 8).astype(np.uint8)
+
+    def _imagens(self, logos):
+        """Gera a imagem final de cada logo, na ordem; cada uma só vale até a próxima ser gerada."""
+        vetorizado = (
+            NUMPY_AVAILABLE and self.base.mode in ("RGB", "RGBA")
+            and len({(logo.image.size, logo.posicao) for logo in logos}) == 1
+        )
+        if not vetorizado:
+            for logo in logos:
+                imagem = self.base.copy()
+                imagem.paste(logo.image, logo.posicao, logo.mask)
+                yield imagem
+            return
+        largura, altura = logos[0].image.size
+        x, y = logos[0].posicao
+        trabalho = np.array(self.base, dtype=np.uint8)
+        for regiao in self._regioes(logos):
+            trabalho[y:y + altura, x:x + largura] = regiao
+            yield Image.fromarray(trabalho)
+
+    def renderizar(self, logos, perfil=None):
+        """Codifica o criativo de cada logo; por logo, (bytes, métricas) ou a CriativoAcimaDoLimite."""
+        perfil = perfil or config.PNG_ENCODER_PROFILE
+        resultados = []
+        for imagem in self._imagens(logos):
+            # Codifica antes de pedir a próxima: as imagens do caminho vetorizado dividem o mesmo buffer
+            inicio = time.perf_counter()
+            output = io.BytesIO()
+            salvar_sem_metadados(imagem, output, "PNG", perfil)
+            metricas = {"perfil": perfil, "encode_s": time.perf_counter() - inicio}
+            try:
+                data, metricas["orcamento"] = ajustar_ao_limite(output.getvalue(), ".png")
+                resultados.append((data, metricas))
+            except CriativoAcimaDoLimite as e:
+                resultados.append(e)
+        return resultados
+
+
+def _renderizar_lote_png_job(template_data, logos, dimensoes, perfil):
+    """Job do pool: um template PNG, várias logos."""
+    return CompositorLotePNG(template_data, dimensoes).renderizar(logos, perfil)
+
+
+# Templates PNG à espera de vaga no pool, com as logos que já pediram o mesmo template
+LotePNG = namedtuple("LotePNG", ["template_data", "dimensoes", "perfil", "logos", "futures"])
+
+
+# ------------------------ MOTOR DE RENDERIZAÇÃO ------------------------
+class RenderEngine:
+    """Renderiza criativos num pool de processos para usar todos os núcleos.
+
+    Cada job é (bytes do template, LogoPreparada, dimensões, extensão) e o
+    resultado é o criativo já codificado. Jobs marcados como in_process (ex.:
+    lotes pequenos, em que subir processos não compensa) rodam na própria
+    thread. O pool é criado na primeira utilização e usa "spawn", para não
+    herdar locks das threads de download.
+
+    Criativos PNG que informam a chave do template são agrupados: enquanto
+    todos os processos estão ocupados, pedidos do mesmo template (de sites
+    diferentes) esperam juntos e vão ao pool como um único job do
+    CompositorLotePNG, com até RENDER_LOTE_MAX_LOGOS logos. Com vaga livre,
+    o pedido sai na hora, sem esperar por outros.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or config.RENDER_WORKERS or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._pool = None
+        self.stats = EstatisticasEncoder()
+        self._lotes_lock = threading.Lock()
+        self._lotes = OrderedDict()
+        self._em_andamento = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _registrar(self, future, resultado):
+        """Repassa os bytes ao future do chamador e registra as métricas de encode."""
+        try:
+            data, metricas = resultado.result()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self.stats.registrar(metricas["perfil"], metricas["encode_s"], len(data))
+        if metricas.get("orcamento"):
+            print(f"🗜️ Criativo recodificado para caber no limite de tamanho: {metricas['orcamento']} ({len(data)} bytes)")
+        future.set_result(data)
+
+    def _enviar(self, funcao, *args):
+        """Submete ao pool ocupando uma vaga; ao terminar, a vaga vai para o lote PNG que espera há mais tempo."""
+        with self._lotes_lock:
+            self._em_andamento += 1
+        resultado = self._get_pool().submit(funcao, *args)
+        resultado.add_done_callback(self._liberar_vaga)
+        return resultado
+
+    def _liberar_vaga(self, _):
+        with self._lotes_lock:
+            self._em_andamento -= 1
+            if not self._lotes or self._em_andamento >= self.workers:
+                return
+            _, lote = self._lotes.popitem(last=False)
+        self._enviar_lote(lote)
+
+    def _enviar_lote(self, lote):
+        try:
+            resultado = self._enviar(_renderizar_lote_png_job, lote.template_data, lote.logos, lote.dimensoes, lote.perfil)
+        except Exception as e:
+            # Ex.: pool encerrado enquanto o lote esperava
+            for future in lote.futures:
+                future.set_exception(e)
+            return
+        resultado.add_done_callback(lambda done: self._distribuir(lote.futures, done))
+
+    def _distribuir(self, futures, lote):
+        """Repassa o resultado de cada logo do lote ao future correspondente."""
+        try:
+            resultados = lote.result()
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, resultado in zip(futures, resultados):
+            feito = Future()
+            if isinstance(resultado, Exception):
+                feito.set_exception(resultado)
+            else:
+                feito.set_result(resultado)
+            self._registrar(future, feito)
+
+    def _submit_lote_png(self, chave_template, template_data, logo, dimensoes, perfil, future):
+        chave = (chave_template, tuple(dimensoes), perfil)
+        with self._lotes_lock:
+            lote = self._lotes.get(chave)
+            if lote is not None:
+                # Mesmo template já esperando vaga: entra no lote
+                lote.logos.append(logo)
+                lote.futures.append(future)
+                if len(lote.logos) < config.RENDER_LOTE_MAX_LOGOS:
+                    return
+                del self._lotes[chave]
+            else:
+                lote = LotePNG(template_data, tuple(dimensoes), perfil, [logo], [future])
+                if self._em_andamento >= self.workers:
+                    self._lotes[chave] = lote
+                    return
+        self._enviar_lote(lote)
+
+    def submit(self, template_data, logo, dimensoes, ext, in_process=False, perfil=None, chave_template=None):
+        """Agenda a renderização e retorna um Future com os bytes do criativo.
+
+        chave_template (ex.: id + versão do template) permite juntar este
+        criativo PNG aos de outros sites com o mesmo template num só job do pool.
+        """
+        # O perfil é resolvido aqui: os processos do pool não enxergam alterações feitas no config em runtime
+        perfil = perfil or config.PNG_ENCODER_PROFILE
+        future = Future()
+        if in_process or self.workers <= 1:
+            resultado = Future()
+            try:
+                resultado.set_result(_renderizar_job(template_data, logo, dimensoes, ext, perfil))
+            except Exception as e:
+                resultado.set_exception(e)
+            self._registrar(future, resultado)
+        elif ext == ".png" and chave_template is not None and config.RENDER_LOTE_MAX_LOGOS > 1:
+            self._submit_lote_png(chave_template, template_data, logo, dimensoes, perfil, future)
+        else:
+            resultado = self._enviar(_renderizar_job, template_data, logo, dimensoes, ext, perfil)
+            resultado.add_done_callback(lambda done: self._registrar(future, done))
+        return future
+
+    def submit_preparo(self, template_data, ext, dimensoes, in_process=False):
+        """Agenda preparar_template no pool (fora do processo principal) e retorna um Future com os bytes."""
+        if in_process or self.workers <= 1:
+            future = Future()
+            try:
+                future.set_result(preparar_template(template_data, ext, dimensoes))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._enviar(preparar_template, template_data, ext, dimensoes)
+
+    def shutdown(self):
+        with self._lotes_lock:
+            lotes, self._lotes = list(self._lotes.values()), OrderedDict()
+        for lote in lotes:
+            for future in lote.futures:
+                future.set_exception(RuntimeError("RenderEngine encerrado"))
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+_render_engine = None
+_render_engine_lock = threading.Lock()
+
+
+def get_render_engine():
+    """Retorna o RenderEngine único do processo."""
+    global _render_engine
+    if _render_engine is None:
+        with _render_engine_lock:
+            if _render_engine is None:
+                _render_engine = RenderEngine()
+                atexit.register(_render_engine.shutdown)
+    return _render_engine
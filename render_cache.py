@@ -0,0 +1,234 @@
+import hashlib
+import os
+import threading
+
+from config import config
+from drive_cache import DiscoLRU, extensao_template, get_file_cache, get_template_manifest
+from render import get_render_engine
+
+# Mude quando a renderização passar a gerar bytes diferentes para as mesmas entradas
+VERSAO_RENDER = "1"
+
+
+class ChecksumsLogo:
+    """sha1 do conteúdo das logos, recalculado só quando o arquivo muda (caminho, mtime, tamanho)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checksums = {}
+
+    def get(self, logo_path):
+        stat = os.stat(logo_path)
+        key = (os.path.abspath(logo_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            checksum = self._checksums.get(key)
+        if checksum is None:
+            with open(logo_path, "rb") as f:
+                checksum = hashlib.sha1(f.read()).hexdigest()
+            with self._lock:
+                self._checksums[key] = checksum
+        return checksum
+
+
+_checksums_logo = ChecksumsLogo()
+
+
+def checksum_logo(logo_path):
+    """Checksum do arquivo de logo (cacheado por caminho, mtime e tamanho)."""
+    return _checksums_logo.get(logo_path)
+
+
+def chave_render(versao_template, logo_checksum, dimensoes, logo_size, ext, perfil):
+    """Chave do criativo renderizado; None quando o template não tem versão conhecida.
+
+    Inclui tudo o que altera os bytes gerados: template, logo, DIMENSOES,
+    LOGO_SIZE, formato, perfil do encoder, o limite de tamanho do criativo e,
+    nos GIFs, GIF_PALETTE_SAMPLES (frames usados para a paleta global).
+    Mudanças no código de renderização pedem um novo VERSAO_RENDER.
+    """
+    if not versao_template or not logo_checksum:
+        return None
+    partes = [
+        VERSAO_RENDER, versao_template, logo_checksum,
+        "x".join(map(str, dimensoes)), "x".join(map(str, logo_size)),
+        ext, perfil, str(config.MAX_CREATIVE_BYTES),
+    ]
+    if ext == ".gif":
+        partes.append(str(config.GIF_PALETTE_SAMPLES))
+    return hashlib.sha1("|".join(partes).encode()).hexdigest()
+
+
+class RenderCache(DiscoLRU):
+    """Cache em disco de criativos já codificados, endereçado pelo conteúdo das entradas.
+
+    Um acerto devolve os bytes gravados na primeira renderização, sem baixar
+    o template nem renderizar de novo (útil ao repetir uma campanha, tentar de
+    novo após falha no upload ou atender vários grupos do mesmo site). O
+    tamanho total é limitado a max_bytes, removendo primeiro os criativos
+    usados há mais tempo (LRU). O índice é mantido em index.json. A mesma
+    estrutura guarda os templates pré-redimensionados (PreparedTemplates).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, nome="Cache de renderização"):
+        super().__init__(
+            cache_dir or config.RENDER_CACHE_DIR,
+            config.RENDER_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            nome
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ativo(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Retorna os bytes guardados ou None (falta, chave None ou cache desativado)."""
+        if key is None or not self.ativo:
+            return None
+        with self._lock:
+            entry = self._acessar(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            path = os.path.join(self.cache_dir, entry['blob'])
+        data = self._ler(key, path)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Guarda os bytes sob a chave."""
+        if key is None or not self.ativo:
+            return
+        self._gravar(key, key, data)
+
+    def resumo(self):
+        """Linha com acertos, faltas e ocupação do cache (vazia se não houve consultas)."""
+        with self._lock:
+            consultas = self.hits + self.misses
+            if not consultas:
+                return []
+            ocupado = sum(entry['size'] for entry in self._index.values())
+            return [
+                f"♻️ {self.nome}: {self.hits} acerto(s), {self.misses} falta(s) "
+                f"({self.hits / consultas:.0%}), {len(self._index)} arquivo(s), {ocupado / 1024 / 1024:.1f} MB"
+            ]
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Retorna o cache de renderização único do processo."""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache()
+    return _render_cache
+
+
+# ------------------------ TEMPLATES PRÉ-REDIMENSIONADOS ------------------------
+class PreparedTemplates:
+    """Camada derivada do cache do Drive: templates já redimensionados para DIMENSOES.
+
+    A chave é a versão do template (md5Checksum ou modifiedTime) + dimensões +
+    formato; o conteúdo vem de preparar_template (PNG redimensionado, ou frames
+    do GIF decodificados e redimensionados). Assim cada site só cola a logo e
+    codifica. A preparação roda no pool do RenderEngine, como a renderização.
+    Quando o manifesto muda, até PREPARED_TEMPLATE_WARMUP_MAX templates
+    alterados que já estão no cache local do Drive são preparados numa única
+    thread em segundo plano.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or RenderCache(
+            config.PREPARED_TEMPLATE_DIR,
+            config.PREPARED_TEMPLATE_MAX_MB * 1024 * 1024,
+            nome="Templates pré-redimensionados"
+        )
+        self._aquecendo = threading.Lock()
+
+    @staticmethod
+    def chave(template, dimensoes):
+        versao = template.checksum or template.modified_time
+        if not versao:
+            return None
+        partes = [VERSAO_RENDER, template.id, versao, "x".join(map(str, dimensoes)), extensao_template(template)]
+        return hashlib.sha1("|".join(partes).encode()).hexdigest()
+
+    def get_bytes(self, template, dimensoes=None, in_process=False):
+        """Retorna o template pronto para colar a logo, preparando-o (e baixando-o) se preciso.
+
+        Com a camada desativada (PREPARED_TEMPLATE_MAX_MB=0) retorna o template
+        original: prepará-lo só para a renderização decodificar de novo não compensa.
+        """
+        if not self.cache.ativo:
+            return get_file_cache().get_template_bytes(template)
+        dimensoes = tuple(dimensoes or config.DIMENSOES)
+        key = self.chave(template, dimensoes)
+        data = self.cache.get(key)
+        if data is None:
+            original = get_file_cache().get_template_bytes(template)
+            data = get_render_engine().submit_preparo(original, extensao_template(template), dimensoes, in_process).result()
+            self.cache.put(key, data)
+        return data
+
+    def aquecer(self, templates, dimensoes=None, limite=None):
+        """Prepara até `limite` templates ainda ausentes que já foram usados (estão no cache local do Drive)."""
+        if not self.cache.ativo:
+            return
+        dimensoes = tuple(dimensoes or config.DIMENSOES)
+        limite = config.PREPARED_TEMPLATE_WARMUP_MAX if limite is None else limite
+        file_cache = get_file_cache()
+        pendentes = [
+            template for template in templates
+            if self.chave(template, dimensoes) and not self.cache.contem(self.chave(template, dimensoes))
+            and file_cache.contem(template.id)
+        ][:limite]
+        for template in pendentes:
+            try:
+                self.get_bytes(template, dimensoes)
+            except Exception as e:
+                print(f"⚠️ Não foi possível preparar o template {template.name}: {e}")
+        if pendentes:
+            print(f"🔥 {len(pendentes)} template(s) pré-redimensionado(s) em segundo plano")
+
+    def aquecer_em_background(self, templates):
+        """Aquece numa thread; se já houver um aquecimento em andamento, o pedido é ignorado
+        (o que faltar é preparado quando for usado)."""
+        if not self._aquecendo.acquire(blocking=False):
+            return
+
+        def aquecer():
+            try:
+                self.aquecer(templates)
+            finally:
+                self._aquecendo.release()
+
+        threading.Thread(target=aquecer, daemon=True).start()
+
+
+_prepared_templates = None
+_prepared_templates_lock = threading.Lock()
+
+
+def get_prepared_templates():
+    """Retorna a camada de templates pré-redimensionados única do processo.
+
+    Na criação, passa a acompanhar as mudanças do manifesto de templates
+    (PREPARED_TEMPLATE_WARMUP) e já aquece, dentro do limite, o que o manifesto carregado tiver.
+    """
+    global _prepared_templates
+    if _prepared_templates is None:
+        with _prepared_templates_lock:
+            if _prepared_templates is None:
+                _prepared_templates = PreparedTemplates()
+                if config.PREPARED_TEMPLATE_WARMUP:
+                    get_template_manifest().on_change(_prepared_templates.aquecer_em_background)
+    return _prepared_templates
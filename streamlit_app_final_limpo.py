@@ -11,12 +11,14 @@ import plotly.express as px
 # Import functions from main.py
 from main import (
     ler_planilha, 
-    buscar_logo_por_site, 
-    gerar_criativos, 
-    get_existing_creatives, 
-    upload_creatives,
-    buscar_idioma_por_pais
+    buscar_urls_finais, 
+    jobs_campanhas,
+    abrir_execucao,
+    processar_campanhas,
+    relatorio_campanhas
 )
+from render import PERFIS_PNG, get_render_engine
+from render_cache import get_prepared_templates, get_render_cache
 from google.ads.googleads.client import GoogleAdsClient
 
 # Configure logging
@@ -247,6 +249,22 @@ def initialize_session_state():
     if 'client' not in st.session_state:
         st.session_state.client = None
 
+def extract_ids(row):
+    """Convert the sheet IDs of a row to (account_id, ad_group_id)"""
+    account_id = str(int(row["ID da Conta"].replace("-", "")))
+    ad_group_id = str(int(row["ID do Grupo de Anúncios"]))
+    return account_id, ad_group_id
+
+def fetch_final_urls(df, client):
+    """Fetch the final URLs of every valid row with one query per customer"""
+    pairs = []
+    for idx, row in df.iterrows():
+        try:
+            pairs.append(extract_ids(row))
+        except Exception:
+            continue
+    return buscar_urls_finais(client, pairs)
+
 def check_urls_for_campaigns(df, client):
     """Check which campaigns need manual URLs"""
     campaigns_needing_urls = []
@@ -254,20 +272,21 @@ def check_urls_for_campaigns(df, client):
     
     progress_bar = st.progress(0)
     status_text = st.empty()
+    status_text.text("Verificando campanhas...")
+    
+    # One GAQL query per customer instead of one per ad group
+    final_urls = fetch_final_urls(df, client)
     
     for i, (idx, row) in enumerate(df.iterrows()):
         try:
             progress = float(i + 1) / float(len(df))
             progress_bar.progress(progress)
-            if i == 0:
-                status_text.text("Verificando campanhas...")
             
             # Convert IDs
-            account_id = str(int(row["ID da Conta"].replace("-", "")))
-            ad_group_id = str(int(row["ID do Grupo de Anúncios"]))
+            account_id, ad_group_id = extract_ids(row)
             
             # Check for existing creatives
-            final_url = get_existing_creatives(client, account_id, ad_group_id)
+            final_url = final_urls.get((account_id, ad_group_id))
             
             if final_url:
                 campaigns_with_urls.append({
@@ -338,58 +357,44 @@ def process_campaigns_with_urls(df, client, manual_urls, creative_config):
     """Process campaigns with collected URLs"""
     progress_bar = st.progress(0)
     status_text = st.empty()
-    total_campaigns = len(df)
-    processed = 0
-    success_count = 0
-    errors = []
-    for idx, row in df.iterrows():
-        try:
-            processed += 1
-            progress = float(processed) / float(total_campaigns)
-            progress_bar.progress(progress)
-            site = row["Site"]
-            if processed == 1:
-                status_text.text("Processando campanhas...")
-            account_id = str(int(row["ID da Conta"].replace("-", "")))
-            ad_group_id = str(int(row["ID do Grupo de Anúncios"]))
-            logo_path = buscar_logo_por_site(site)
-            if not logo_path:
-                errors.append(f"❌ Logo não encontrada para {site}")
-                continue
-            idioma = buscar_idioma_por_pais(row["País"])
-            if not idioma:
-                errors.append(f"❌ Idioma não encontrado para {row['País']} - {site}")
-                continue
-            if creative_config['quantity_input'].lower() == "all":
-                quantidade = "all"
-            else:
-                quantidade = int(creative_config['quantity_input'])
-            criativos = gerar_criativos(
-                site, 
-                idioma, 
-                quantidade, 
-                logo_path, 
-                creative_config['templates_especificos'] if creative_config['creative_type'] == "Específicos" else None
-            )
-            if not criativos:
-                errors.append(f"❌ Nenhum criativo gerado para {site}")
-                continue
-            final_url = get_existing_creatives(client, account_id, ad_group_id)
-            if not final_url:
-                if idx in manual_urls:
-                    final_url = manual_urls[idx]
-                else:
-                    errors.append(f"⚠️ URL final não encontrada para {site}")
-                    continue
-            upload_creatives(client, account_id, ad_group_id, criativos, final_url)
-            success_count += 1
-        except Exception as e:
-            errors.append(f"❌ Erro ao processar {row['Site']}: {str(e)}")
+    status_text.text("Processando campanhas...")
+    if creative_config['quantity_input'].lower() == "all":
+        quantidade = "all"
+    else:
+        quantidade = int(creative_config['quantity_input'])
+    jobs = jobs_campanhas(
+        df,
+        quantidade,
+        creative_config['templates_especificos'] if creative_config['creative_type'] == "Específicos" else None,
+        perfil_png=creative_config.get('encoder_profile')
+    )
+    total_campaigns = len(jobs)
+    finished = []
+
+    def on_job_done(job):
+        # Called on this thread by the pipeline, so Streamlit widgets can be updated here
+        finished.append(job)
+        progress_bar.progress(float(len(finished)) / float(max(1, total_campaigns)))
+        status_text.text(f"Processando campanhas... {len(finished)}/{total_campaigns} ({job.site})")
+
+    final_urls = fetch_final_urls(df, client)
+    execucao = abrir_execucao(jobs, creative_config.get('resume', False))
+    jobs = processar_campanhas(client, jobs, final_urls, manual_urls, on_job_done, execucao=execucao)
+    report = relatorio_campanhas(jobs)
+    success_count = sum(1 for job in jobs if not job.falhou)
+    errors = [f"❌ {line['Site']}: [{line['Etapa']}] {line['Erro']}" for line in report if line["Erro"]]
     progress_bar.progress(1.0)
     status_text.text("✅ Processamento concluído!")
     st.markdown('<div class="success-box">', unsafe_allow_html=True)
     st.success(f"🎉 Processamento concluído! {success_count}/{total_campaigns} campanhas processadas com sucesso.")
     st.markdown('</div>', unsafe_allow_html=True)
+    with st.expander("Ver resultado por grupo de anúncios"):
+        st.dataframe(pd.DataFrame(report), use_container_width=True)
+    encoder_stats = get_render_engine().stats.resumo() + get_render_cache().resumo() + get_prepared_templates().cache.resumo()
+    if encoder_stats:
+        with st.expander("Ver estatísticas do encoder"):
+            for line in encoder_stats:
+                st.write(line)
     if errors:
         st.markdown('<div class="warning-box">', unsafe_allow_html=True)
         st.warning(f"⚠️ {len(errors)} campanhas tiveram erro. Veja detalhes abaixo.")
@@ -436,7 +441,7 @@ def main():
             with st.spinner("Listando logos disponíveis..."):
                 try:
                     from main import list_all_logos
-                    logos = list_all_logos()
+                    logos = list_all_logos(refresh=True)
                     if logos:
                         st.markdown('<div class="success-box">✅ Logos encontradas</div>', unsafe_allow_html=True)
                         with st.expander("Ver todas as logos"):
@@ -604,6 +609,20 @@ def main():
             value="2"
         )
         
+        encoder_profiles = sorted(PERFIS_PNG)
+        encoder_profile = st.selectbox(
+            "Perfil do encoder PNG:",
+            encoder_profiles,
+            index=encoder_profiles.index(config.PNG_ENCODER_PROFILE) if config.PNG_ENCODER_PROFILE in encoder_profiles else 0,
+            help="fast: renderiza mais rápido • smallest: arquivos menores para upload"
+        )
+        
+        resume_run = st.checkbox(
+            "Retomar execução anterior",
+            value=False,
+            help="Retoma a última execução destas campanhas que não terminou: pula os grupos já concluídos nela e envia criativos renderizados que ficaram sem upload"
+        )
+        
         # Check URLs button
         if st.button("🔍 Verificar URLs das Campanhas", type="secondary", use_container_width=True):
             # Initialize Google Ads client
@@ -660,7 +679,9 @@ def main():
                     creative_config = {
                         'creative_type': creative_type,
                         'templates_especificos': templates_especificos,
-                        'quantity_input': quantity_input
+                        'quantity_input': quantity_input,
+                        'encoder_profile': encoder_profile,
+                        'resume': resume_run
                     }
                     
                     process_campaigns_with_urls(
@@ -681,7 +702,9 @@ def main():
                 creative_config = {
                     'creative_type': creative_type,
                     'templates_especificos': templates_especificos,
-                    'quantity_input': quantity_input
+                    'quantity_input': quantity_input,
+                    'encoder_profile': encoder_profile,
+                    'resume': resume_run
                 }
                 
                 process_campaigns_with_urls(